@@ -0,0 +1,149 @@
+import asyncio
+import aiohttp
+import discord
+from caches.async_base_cache import AsyncBaseCache
+from cross_poster import DeliveryTracker, format_message
+
+
+class AsyncCrossPoster:
+    def __init__(
+        self,
+        *,
+        cache: AsyncBaseCache,
+        webhook_urls: list,
+        username: str,
+        avatar_url: str,
+        reddit_config_url: str,
+        max_concurrent_webhooks: int = 4
+    ):
+        """
+        The asyncio counterpart of CrossPoster, posting with py-cord's async webhooks.
+        py-cord's async webhooks keep track of Discord's rate limits themselves. Like
+        CrossPoster, it remembers which webhooks a submission already reached, so a
+        retry only goes to the ones it didn't.
+
+        Parameters
+        ----------
+        cache : AsyncBaseCache
+            The cache to record posted submissions in.
+        webhook_urls : list
+            A list of webhook urls to use for posting.
+        username : str
+            The username to use when posting to Discord.
+        avatar_url : str
+            The URL for the avatar to use for the user when posting to Discord.
+        reddit_config_url : str
+            What URL to use for Reddit.
+        max_concurrent_webhooks : int
+            The most webhooks that are sent to at the same time.
+        """
+        self.cache = cache
+        self.avatar_url = avatar_url
+        self.username = username
+        self.webhook_urls = webhook_urls
+        self.reddit_config_url = reddit_config_url
+        self.limit = asyncio.Semaphore(max(max_concurrent_webhooks, 1))
+        self.session = None
+        self.tracker = DeliveryTracker(self.webhook_urls)
+
+    async def send_to_webhook(self, webhook_url: str, messages: list) -> int:
+        """
+        Sends messages to one webhook in order, stopping at the first failure so that
+        nothing is posted out of order.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook to send to.
+        messages : list[str]
+            The messages to send, oldest first.
+
+        Returns
+        -------
+        int
+            How many of the messages were sent.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        webhook = discord.Webhook.from_url(webhook_url, session=self.session)
+        async with self.limit:
+            for sent, message in enumerate(messages):
+                try:
+                    await webhook.send(
+                        message,
+                        username=self.username,
+                        avatar_url=self.avatar_url,
+                    )
+                except (
+                    discord.DiscordException,
+                    aiohttp.ClientError,
+                    asyncio.TimeoutError,
+                ) as e:
+                    print("Error sending to webhook, will retry later: {}".format(e))
+                    return sent
+
+        return len(messages)
+
+    async def post_submissions(self, submissions: list) -> list:
+        """
+        Posts submissions to all webhook urls this crossposter has, concurrently across
+        webhooks but in order within each. A submission that already reached some
+        webhooks in an earlier, partly failed attempt is only sent to the webhooks it
+        hasn't reached yet, and newer submissions are held back from a webhook while
+        older ones are waiting to be retried on it.
+
+        Parameters
+        ----------
+        submissions : list
+            The Reddit submissions to be posted to Discord, oldest first.
+
+        Returns
+        -------
+        list
+            The submissions that have now been posted to every webhook.
+        """
+        messages = [
+            format_message(submission, self.reddit_config_url)
+            for submission in submissions
+        ]
+        pending = self.tracker.pending(submissions)
+        sent_counts = await asyncio.gather(
+            *(
+                self.send_to_webhook(
+                    webhook_url, [messages[index] for index in pending[webhook_url]]
+                )
+                for webhook_url in self.webhook_urls
+            )
+        )
+
+        for webhook_url, sent in zip(self.webhook_urls, sent_counts):
+            self.tracker.mark_sent(
+                webhook_url,
+                [submissions[index] for index in pending[webhook_url][:sent]],
+            )
+        self.tracker.hold(submissions)
+
+        return self.tracker.delivered(submissions)
+
+    async def record_submissions(self, submissions: list):
+        """
+        Records submissions that were posted to Discord in the cache, in one batch.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions that were successfully posted to every webhook.
+        """
+        added = await self.cache.add_posts(submissions)
+        self.tracker.forget(submissions)
+        if len(added) != len(submissions):
+            print(
+                "{} posts were already in the cache.".format(
+                    len(submissions) - len(added)
+                )
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
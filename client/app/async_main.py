@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+import asyncio
+import configparser
+import time
+from datetime import datetime
+
+import aiohttp
+import asyncpraw
+import asyncprawcore
+
+from caches import AsyncCache
+from caches.async_rest_cache import AsyncRESTCache
+from async_cross_poster import AsyncCrossPoster
+from main import CONFIG_FILE, RECORD_ATTEMPTS, RECORD_RETRY_DELAY, subreddit_overrides
+from submission_validator import AsyncSubmissionValidator
+from subreddit_post_gatherer import SubredditPostGatherer
+
+# what the cache raises when the server can't be reached or gives a bad answer
+CACHE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+
+class AsyncPipeline:
+    """
+    Runs the client as overlapping asyncio stages instead of one step after another:
+    gathering posts from Reddit, checking them against the cache, delivering them to
+    Discord and recording them in the cache. The stages are connected by bounded
+    queues, so a slow stage holds the ones before it back instead of letting work pile
+    up.
+
+    Which posts are new, old enough or removed is worked out by a
+    SubredditPostGatherer, the same as for the synchronous client, and only the calls
+    to Reddit are made here.
+    """
+
+    def __init__(
+        self,
+        *,
+        reddit: asyncpraw.Reddit,
+        cache,
+        cross_poster: AsyncCrossPoster,
+        subreddit_gatherer: SubredditPostGatherer,
+        wait_period: int,
+        interval: float = 30,
+        queue_size: int = 16
+    ):
+        """
+        Initializer for AsyncPipeline.
+
+        Parameters
+        ----------
+        reddit : asyncpraw.Reddit
+            The reddit object to gather posts with.
+        cache : AsyncBaseCache
+            The cache to check posts against.
+        cross_poster : AsyncCrossPoster
+            The crossposter to deliver and record posts with.
+        subreddit_gatherer : SubredditPostGatherer
+            The gatherer for the subreddits, with an AsyncSubmissionValidator to look
+            waiting posts up again with.
+        wait_period : int
+            Required 'age' of post (in minutes) to be posted.
+        interval : float
+            The longest time to wait between checking for new posts, in seconds.
+        queue_size : int
+            The most batches of posts waiting between two stages.
+        """
+        self.reddit = reddit
+        self.cache = cache
+        self.cross_poster = cross_poster
+        self.subreddit_gatherer = subreddit_gatherer
+        self.wait_period = wait_period
+        self.interval = interval
+        self.to_check = asyncio.Queue(queue_size)
+        self.to_deliver = asyncio.Queue(queue_size)
+        self.to_record = asyncio.Queue(queue_size)
+
+    async def watch(self, subreddit_names: list):
+        """
+        Gathering stage for one combined listing. Streams its new posts, passing on the
+        ones old enough to be posted and holding the rest in the delay queue.
+
+        Parameters
+        ----------
+        subreddit_names : list[str]
+            The subreddits in the listing.
+        """
+        while True:
+            try:
+                subreddit = await self.reddit.subreddit("+".join(subreddit_names))
+                fresh = []
+                async for submission in subreddit.stream.submissions(pause_after=0):
+                    if submission is not None:
+                        if self.subreddit_gatherer.mark_seen(submission):
+                            fresh.append(submission)
+                        continue
+
+                    ready = self.subreddit_gatherer.sift(
+                        fresh, self.wait_period, time.time()
+                    )
+                    ready.sort(key=self.subreddit_gatherer.oldest_first)
+                    fresh = []
+                    if ready:
+                        await self.to_check.put(ready)
+                    await asyncio.sleep(self.interval)
+            except (
+                asyncprawcore.exceptions.RequestException,
+                asyncprawcore.exceptions.ServerError,
+                asyncprawcore.exceptions.ResponseException,
+            ) as e:
+                print("Error streaming posts, trying again in a bit: {}".format(e))
+                await asyncio.sleep(self.interval)
+
+    async def release(self):
+        """
+        Gathering stage for held posts. Passes them on as they come out of their wait
+        period, after looking them up again to drop ones removed in the meantime.
+        """
+        while True:
+            next_due = self.subreddit_gatherer.next_due()
+            pause = self.interval
+            if next_due is not None:
+                pause = min(pause, max(next_due - time.time(), 0))
+            await asyncio.sleep(pause)
+
+            now = time.time()
+            matured = self.subreddit_gatherer.queue.pop_due(now)
+            if not matured:
+                continue
+
+            try:
+                refreshed = await self.subreddit_gatherer.validator.lookup(
+                    [fullname for _, fullname, _ in matured]
+                )
+            except (
+                asyncprawcore.exceptions.RequestException,
+                asyncprawcore.exceptions.ServerError,
+                asyncprawcore.exceptions.ResponseException,
+            ) as e:
+                print("Error looking posts up, trying again in a bit: {}".format(e))
+                refreshed = None
+
+            ready = self.subreddit_gatherer.settle(
+                matured, refreshed, self.wait_period, now
+            )
+            if ready:
+                await self.to_check.put(ready)
+
+    async def check(self):
+        """
+        Dedup stage. Passes on the posts that aren't in the cache yet, putting them
+        back in the delay queue if the cache can't be reached.
+        """
+        while True:
+            submissions = await self.to_check.get()
+            try:
+                good_posts = await self.cache.check_posts(submissions)
+            except CACHE_ERRORS as e:
+                print("Error checking posts, trying again in a bit: {}".format(e))
+                self.subreddit_gatherer.requeue(submissions)
+                continue
+
+            good_ids = {id(submission) for submission in good_posts}
+            self.cross_poster.tracker.forget(
+                [
+                    submission
+                    for submission in submissions
+                    if id(submission) not in good_ids
+                ]
+            )
+            print(
+                "Checked posts at: {} and found {} good posts.".format(
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(good_posts)
+                )
+            )
+            if good_posts:
+                await self.to_deliver.put(good_posts)
+
+    async def deliver(self):
+        """
+        Delivery stage. Posts to Discord, passing delivered posts on to be recorded and
+        putting the rest back in the delay queue to be tried again. Posts that reached
+        some webhooks are only sent to the rest when they're tried again.
+        """
+        while True:
+            submissions = await self.to_deliver.get()
+            delivered = await self.cross_poster.post_submissions(submissions)
+            delivered_ids = {id(submission) for submission in delivered}
+            self.subreddit_gatherer.requeue(
+                [
+                    submission
+                    for submission in submissions
+                    if id(submission) not in delivered_ids
+                ]
+            )
+            if delivered:
+                await self.to_record.put(delivered)
+
+    async def record(self):
+        """
+        Recording stage. Adds delivered posts to the cache, trying a few times if the
+        cache can't be reached. If it still can't, they're put back in the delay queue,
+        and the crossposter remembers they were delivered, so the retry only records
+        them.
+        """
+        while True:
+            submissions = await self.to_record.get()
+            for attempt in range(RECORD_ATTEMPTS):
+                if attempt:
+                    await asyncio.sleep(RECORD_RETRY_DELAY * 2 ** (attempt - 1))
+                try:
+                    await self.cross_poster.record_submissions(submissions)
+                    break
+                except CACHE_ERRORS as e:
+                    print(
+                        "Error recording posts (attempt {} of {}): {}".format(
+                            attempt + 1, RECORD_ATTEMPTS, e
+                        )
+                    )
+            else:
+                self.subreddit_gatherer.requeue(submissions)
+
+    async def run(self):
+        """
+        Runs every stage until one of them fails.
+        """
+        await asyncio.gather(
+            *(
+                self.watch(subreddit_names)
+                for subreddit_names in self.subreddit_gatherer.listings
+            ),
+            self.release(),
+            self.check(),
+            self.deliver(),
+            self.record(),
+        )
+
+
+async def main():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    webhook_urls = [
+        webhook_url.strip()
+        for webhook_url in config["xposter"]["webhook_urls"].split(",")
+    ]
+    subreddit_names = [
+        subreddit_name.strip()
+        for subreddit_name in config["xposter"]["subreddit"].split(",")
+    ]
+    reddit = asyncpraw.Reddit("xpost_bot", user_agent="xpost_bot v0.1")
+    cache = AsyncCache(**config["cache"])
+    cross_poster = AsyncCrossPoster(
+        cache=cache,
+        webhook_urls=webhook_urls,
+        username=config["xposter"].get("username", None),
+        avatar_url=config["xposter"].get("avatar", None),
+        reddit_config_url=reddit.config.reddit_url,
+        max_concurrent_webhooks=int(
+            config["xposter"].get("max_concurrent_webhooks", 4)
+        ),
+    )
+    subreddit_gatherer = SubredditPostGatherer(
+        reddit,
+        subreddit_names,
+        int(config["xposter"]["post_limit"]),
+        wait_periods=subreddit_overrides(config, "wait_period"),
+        validator=AsyncSubmissionValidator(reddit),
+    )
+    pipeline = AsyncPipeline(
+        reddit=reddit,
+        cache=cache,
+        cross_poster=cross_poster,
+        subreddit_gatherer=subreddit_gatherer,
+        wait_period=int(config["xposter"]["wait_period"]),
+        interval=float(config["xposter"].get("stream_interval", 30)),
+    )
+    try:
+        if isinstance(cache, AsyncRESTCache):
+            try:
+                await cache.login()
+            except RuntimeError as e:
+                print(e)
+                exit()
+            except CACHE_ERRORS as e:
+                print("Error reaching the cache server, logging in later: {}".format(e))
+        await pipeline.run()
+    finally:
+        await cross_poster.close()
+        await cache.close()
+        await reddit.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1 +1,2 @@
-from .cache import Cache
\ No newline at end of file
+from .cache import Cache
+from .async_cache import AsyncCache
@@ -0,0 +1,50 @@
+from abc import ABC, abstractmethod
+
+
+class AsyncBaseCache(ABC):
+    """
+    The asyncio counterpart of BaseCache, for the async client pipeline.
+    """
+
+    @abstractmethod
+    async def check_posts(self, submissions: list) -> list:
+        """
+        Checks if multiple submissions are in the cache, and returns only the
+        submissions that are not in the cache.
+
+        Parameters
+        ----------
+        submissions : list
+            A list of the submissions to check for whether or not they're in the cache.
+
+        Returns
+        -------
+        list
+            A list of the submissions from those initially given that are not in the
+            cache.
+        """
+        pass
+
+    @abstractmethod
+    async def add_posts(self, submissions: list) -> list:
+        """
+        Adds multiple posts to the cache in one batch.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to add to the cache.
+
+        Returns
+        -------
+        list
+            The submissions that were newly added, i.e. not already in the cache.
+        """
+        pass
+
+    @abstractmethod
+    async def close(self):
+        """
+        Releases the cache's connections.
+        """
+        pass
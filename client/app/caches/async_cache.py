@@ -0,0 +1,54 @@
+from .async_local_cache import AsyncLocalCache
+from .async_rest_cache import AsyncRESTCache
+
+
+class AsyncCache:
+    """
+    Factory for async caches, taking the same arguments as Cache.
+
+    Parameters
+    ----------
+    localcache_db_filename : str
+        The filename of the .db file to be used for the AsyncLocalCache.
+    username : str
+        The username to use for the AsyncRESTCache and the AsyncLocalCache.
+    password : str
+        The password to use for the AsyncRESTCache.
+    url : str
+        The url to use for the AsyncRESTCache.
+    max_cached_posts : int
+        The most posts the AsyncLocalCache keeps in an exact in-memory set.
+    worker_id : str
+        Not used, the async client doesn't shard. Accepted so it can read the same
+        [cache] section as the Cache.
+    api_key : str
+        An API key the AsyncRESTCache can log in with instead of the password.
+    sqlite_profile : str
+        The AsyncLocalCache's SQLite settings, 'default' or 'performance'.
+    api_key_filename : str
+        The file the AsyncRESTCache saves the API key it makes to, under the database
+        folder, so later runs reuse it. Defaults to '<username>.api_key'.
+    """
+
+    def __new__(
+        cls,
+        localcache_db_filename: str = "",
+        username: str = "",
+        password: str = "",
+        url: str = "",
+        max_cached_posts: int = 1000000,
+        worker_id: str = "",
+        api_key: str = "",
+        sqlite_profile: str = "default",
+        api_key_filename: str = "",
+    ):
+        if localcache_db_filename and username:
+            return AsyncLocalCache(
+                localcache_db_filename, username, max_cached_posts, sqlite_profile
+            )
+
+        if username and (password or api_key) and url:
+            return AsyncRESTCache(username, password, url, api_key, api_key_filename)
+
+        print("Error, check arguments passed to the AsyncCache")
+        return None
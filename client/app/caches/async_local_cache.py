@@ -0,0 +1,49 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .async_base_cache import AsyncBaseCache
+from .local_cache import LocalCache
+
+
+class AsyncLocalCache(AsyncBaseCache):
+    """
+    Async wrapper around a LocalCache. SQLite has no async driver in this project, so
+    the LocalCache is run on a single worker thread, which also keeps its session from
+    being used by two threads at once.
+
+    Parameters
+    ----------
+    localcache_db_filename : str
+        The filename of the .db file to be used for the LocalCache.
+    username : str
+        The username to store posts under.
+    max_cached_posts : int
+        The most posts kept in an exact in-memory set.
+    sqlite_profile : str
+        The SQLite settings to use, 'default' or 'performance'.
+    """
+
+    def __init__(
+        self,
+        localcache_db_filename: str,
+        username: str,
+        max_cached_posts: int = 1000000,
+        sqlite_profile: str = "default",
+    ):
+        self.local_cache = LocalCache(
+            localcache_db_filename, username, max_cached_posts, sqlite_profile
+        )
+        self.username = username
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function, *args)
+
+    async def check_posts(self, submissions: list) -> list:
+        return await self._run(self.local_cache.check_posts, submissions)
+
+    async def add_posts(self, submissions: list) -> list:
+        return await self._run(self.local_cache.add_posts, submissions)
+
+    async def close(self):
+        self.executor.shutdown()
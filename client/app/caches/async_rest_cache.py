@@ -0,0 +1,175 @@
+import time
+from urllib.parse import urljoin
+import aiohttp
+from .async_base_cache import AsyncBaseCache
+from .rest_cache import RESTCache
+
+
+class AsyncRESTCache(AsyncBaseCache):
+    """
+    Async variant of the RESTCache, using one pooled aiohttp session and reusing its
+    token until it is about to expire.
+
+    Parameters
+    ----------
+    username : str
+        The username to log in with.
+    password : str
+        The password to log in with.
+    url : str
+        The url the server is at.
+    api_key : str
+        An API key to log in with instead of the password.
+    api_key_filename : str
+        Where a key made by logging in with the password is saved for later runs,
+        under the database folder.
+    """
+
+    TOKEN_REFRESH_MARGIN = RESTCache.TOKEN_REFRESH_MARGIN
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        url: str,
+        api_key: str = "",
+        api_key_filename: str = "",
+    ):
+        self.username = username
+        self.password = password
+        self.url = url
+        self.api_key_path = RESTCache.DATABASE_FOLDER + (
+            api_key_filename or "{}.api_key".format(username)
+        )
+        self.api_key = api_key or RESTCache.load_api_key(self.api_key_path)
+        self.token_header = None
+        self.token_expiry = 0
+        self.session = None
+
+    async def login(self):
+        """
+        Gets a token to use for later requests, the same way as RESTCache.login.
+
+        Raises
+        ------
+        RuntimeError
+            If the server turns the API key or password down.
+        aiohttp.ClientError
+            If the server can't be reached or has an error of its own.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        token = None
+        if self.api_key:
+            token_url = urljoin(self.url, "users/token")
+            async with self.session.post(
+                token_url, json={"api_key": self.api_key}
+            ) as resp:
+                if resp.status <= 299:
+                    token = (await resp.json())["token"]
+                elif resp.status >= 500:
+                    resp.raise_for_status()
+                elif not self.password:
+                    raise RuntimeError("Error with logging in, check the api_key!")
+
+        if token is None:
+            login_url = urljoin(self.url, "users/login")
+            auth = aiohttp.BasicAuth(self.username, self.password)
+            async with self.session.get(login_url, auth=auth) as resp:
+                if resp.status >= 500:
+                    resp.raise_for_status()
+                if resp.status > 299:
+                    raise RuntimeError("Error with logging in!")
+                token = (await resp.json())["token"]
+
+            key_url = urljoin(self.url, "users/api_keys")
+            headers = {"Authorization": "Bearer {}".format(token)}
+            async with self.session.post(key_url, headers=headers) as resp:
+                if resp.status <= 299:
+                    self.api_key = (await resp.json())["api_key"]
+                    RESTCache.save_api_key(self.api_key_path, self.api_key)
+
+        self.token_header = {"Authorization": "Bearer {}".format(token)}
+        self.token_expiry = RESTCache.token_expiry_time(token)
+
+    async def request(self, method: str, url: str, **kwargs):
+        """
+        Sends an authorized request, logging in first if the token is missing or about
+        to expire, and once more if the server rejects it.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method to use.
+        url : str
+            The url to send the request to.
+
+        Returns
+        -------
+        Any
+            The response's JSON.
+
+        Raises
+        ------
+        aiohttp.ClientResponseError
+            If the server answers with an error.
+        """
+        if (
+            self.token_header is None
+            or time.time() > self.token_expiry - self.TOKEN_REFRESH_MARGIN
+        ):
+            await self.login()
+
+        for attempt in range(2):
+            async with self.session.request(
+                method, url, headers=self.token_header, **kwargs
+            ) as resp:
+                if resp.status == 401 and not attempt:
+                    await self.login()
+                    continue
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+    @staticmethod
+    def _posts_dict(submissions: list) -> dict:
+        return {
+            "posts": [
+                {
+                    "subreddit": submission.subreddit.display_name,
+                    "post_id": submission.id,
+                    "created_utc": submission.created_utc,
+                }
+                for submission in submissions
+            ]
+        }
+
+    async def check_posts(self, submissions: list) -> list:
+        if not submissions:
+            return []
+
+        result = await self.request(
+            "GET", urljoin(self.url, "posts/"), json=self._posts_dict(submissions)
+        )
+        return [
+            submission
+            for submission, post in zip(submissions, result["posts"])
+            if not post["exists"]
+        ]
+
+    async def add_posts(self, submissions: list) -> list:
+        if not submissions:
+            return []
+
+        result = await self.request(
+            "POST", urljoin(self.url, "posts/"), json=self._posts_dict(submissions)
+        )
+        return [
+            submission
+            for submission, post in zip(submissions, result)
+            if not post["exists"]
+        ]
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
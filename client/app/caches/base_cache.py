@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 
+
 class BaseCache(ABC):
     @abstractmethod
     def check_post(self, user: str, submission):
@@ -51,13 +52,76 @@ class BaseCache(ABC):
         pass
 
     @abstractmethod
-    def add_posts(self, submissions):
+    def add_posts(self, submissions: list) -> list:
         """
-        Adds multiple posts to the cache.
+        Adds multiple posts to the cache in one batch.
 
         Parameters
         ----------
         submissions : list
             The submissions to add to the cache.
+
+        Returns
+        -------
+        list
+            The submissions that were newly added, i.e. not already in the cache.
+        """
+        pass
+
+    @abstractmethod
+    def claim_posts(self, submissions: list, lease: float = 300) -> tuple:
+        """
+        Checks and claims submissions in one step, before crossposting them. Only
+        submissions that aren't in the cache and aren't already claimed are claimed,
+        and they stay claimed until the claim is committed or released, or the lease
+        runs out.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to claim.
+        lease : float
+            How long the claims last, in seconds.
+
+        Returns
+        -------
+        tuple[str, list]
+            The claim token, and the submissions that were claimed under it.
         """
-        pass
\ No newline at end of file
+        pass
+
+    @abstractmethod
+    def commit_claim(self, token: str, submissions: list) -> list:
+        """
+        Adds claimed submissions to the cache once they've been crossposted, which also
+        drops their claims.
+
+        Parameters
+        ----------
+        token : str
+            The claim token the submissions were claimed under.
+        submissions : list
+            The submissions to add.
+
+        Returns
+        -------
+        list
+            The submissions that were newly added, i.e. not already in the cache.
+        """
+        pass
+
+    @abstractmethod
+    def release_claim(self, token: str, submissions: list = None):
+        """
+        Gives up claimed submissions that weren't crossposted, so they can be claimed
+        again.
+
+        Parameters
+        ----------
+        token : str
+            The claim token the submissions were claimed under.
+        submissions : list, optional
+            The submissions to release. If not given, everything still claimed under
+            the token is released.
+        """
+        pass
@@ -0,0 +1,53 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    A fixed-size probabilistic set. Membership tests can give false positives (at
+    roughly the error rate it was sized for) but never false negatives.
+
+    Parameters
+    ----------
+    capacity : int
+        The number of items the filter is sized to hold.
+    error_rate : float
+        The desired false positive rate once capacity items have been added.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, key: str):
+        """
+        Adds a key to the filter.
+
+        Parameters
+        ----------
+        key : str
+            The key to add.
+        """
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def memory_usage(self) -> int:
+        """
+        Returns the number of bytes used for the filter's bits.
+        """
+        return len(self.bits)
@@ -23,6 +23,19 @@ class Cache:
         The password to use for the RESTCache.
     url : str
         The url to use for the RESTCache.
+    max_cached_posts : int
+        The most posts the LocalCache keeps in an exact in-memory set, past which it
+        switches to a Bloom filter.
+    worker_id : str
+        The id the RESTCache uses for this client when sharding subreddits between
+        several clients. Defaults to the hostname.
+    api_key : str
+        An API key the RESTCache can log in with instead of the password.
+    sqlite_profile : str
+        The LocalCache's SQLite settings, 'default' or 'performance'.
+    api_key_filename : str
+        The file the RESTCache saves the API key it makes to, under the database
+        folder, so later runs reuse it. Defaults to '<username>.api_key'.
 
     """
 
@@ -32,12 +45,21 @@ class Cache:
         username: str = "",
         password: str = "",
         url: str = "",
+        max_cached_posts: int = 1000000,
+        worker_id: str = "",
+        api_key: str = "",
+        sqlite_profile: str = "default",
+        api_key_filename: str = "",
     ):
         if localcache_db_filename and username:
-            return LocalCache(localcache_db_filename, username)
+            return LocalCache(
+                localcache_db_filename, username, max_cached_posts, sqlite_profile
+            )
 
-        if username and password and url:
-            return RESTCache(username, password, url)
+        if username and (password or api_key) and url:
+            return RESTCache(
+                username, password, url, worker_id, api_key, api_key_filename
+            )
 
         print("Error, check arguments passed to the Cache")
         return None
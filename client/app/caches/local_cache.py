@@ -1,6 +1,13 @@
 from .base_cache import BaseCache
+from .bloom_filter import BloomFilter
 import base
+import datetime
+import migrations
+import sys
+import time
+import uuid
 import sqlalchemy
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import sessionmaker
 from client_post import ClientPost
 
@@ -9,6 +16,11 @@ class LocalCache(BaseCache):
     """
     Cache variant where whether or not posts have been crossposted is stored locally.
 
+    The user's known posts are loaded into memory at startup, so checking posts doesn't
+    need to touch the database. Histories of up to max_cached_posts are held in an exact
+    hash set, larger ones in a Bloom filter, where only possible hits are confirmed
+    against the database.
+
     Parameters
     ----------
     Cache : MetaClass
@@ -16,53 +28,278 @@ class LocalCache(BaseCache):
     """
 
     DATABASE_FOLDER = "/database_folder/"
+    # engines by db filename, so caches for different users share connections
+    engines = {}
+    # each key in a tuple IN takes two of SQLite's bound parameters
+    QUERY_CHUNK_SIZE = 400
+    # pragmas for each sqlite_profile, set on every new connection. The performance
+    # profile writes to a WAL and only syncs it at checkpoints, so a commit is an
+    # append instead of several fsyncs, which matters on SD cards. A crash of the
+    # client loses nothing, but a power cut can roll back the last few commits, and
+    # the posts they recorded would be crossposted again. The database itself can't be
+    # corrupted either way.
+    SQLITE_PROFILES = {
+        "default": {},
+        "performance": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 64 * 1024 * 1024,
+            # negative sizes are in KiB
+            "cache_size": -16 * 1024,
+            "temp_store": "MEMORY",
+        },
+    }
 
-    def __init__(self, localcache_db_filename: str, username: str):
+    def __init__(
+        self,
+        localcache_db_filename: str,
+        username: str,
+        max_cached_posts: int = 1000000,
+        sqlite_profile: str = "default",
+    ):
         self.db_filename = localcache_db_filename
         self.username = username
-        self.cache = {}
-        engine = sqlalchemy.create_engine(
-            "sqlite:///" + self.DATABASE_FOLDER + localcache_db_filename
-        )
-        base.Base.metadata.create_all(engine, checkfirst=True)
-        Session = sessionmaker(bind=engine)
+        self.max_cached_posts = int(max_cached_posts)
+        if sqlite_profile not in self.SQLITE_PROFILES:
+            print("Unknown sqlite_profile {}, using default.".format(sqlite_profile))
+            sqlite_profile = "default"
+        # the first cache for a db file picks the profile, later ones share its engine
+        if localcache_db_filename not in self.engines:
+            engine = sqlalchemy.create_engine(
+                "sqlite:///" + self.DATABASE_FOLDER + localcache_db_filename
+            )
+            pragmas = self.SQLITE_PROFILES[sqlite_profile]
+            if pragmas:
+                sqlalchemy.event.listen(engine, "connect", self._pragma_setter(pragmas))
+            base.Base.metadata.create_all(engine, checkfirst=True)
+            migrations.upgrade(engine)
+            self.engines[localcache_db_filename] = engine
+        self.engine = self.engines[localcache_db_filename]
+        Session = sessionmaker(bind=self.engine)
         self.session = Session()
+        # (subreddit, post_id) -> (claim token, lease expiry) of posts being
+        # crossposted, only one process uses the db file so these stay in memory
+        self.claims = {}
+        self._load_cache()
 
-    def check_post(self, submission):
-        post = (
-            self.session.query(ClientPost)
-            .filter_by(
-                username=self.username,
-                subreddit=submission.subreddit.display_name,
-                post_id=submission.id,
+    @staticmethod
+    def _pragma_setter(pragmas: dict):
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas.items():
+                cursor.execute("PRAGMA {}={}".format(pragma, value))
+            cursor.close()
+
+        return set_pragmas
+
+    @staticmethod
+    def _key(submission) -> tuple:
+        return (sys.intern(submission.subreddit.display_name), submission.id)
+
+    def _load_cache(self):
+        """
+        Loads this user's known (subreddit, post_id) keys into self.cache, as a set, or
+        a Bloom filter if there are more than max_cached_posts.
+        """
+        query = self.session.query(ClientPost.subreddit, ClientPost.post_id).filter_by(
+            username=self.username
+        )
+        count = query.count()
+
+        if count <= self.max_cached_posts:
+            cache = set()
+            for subreddit, post_id in query.yield_per(10000):
+                cache.add((sys.intern(subreddit), post_id))
+            kind = "hash set"
+        else:
+            # leave room for the posts added while running
+            cache = BloomFilter(count * 2)
+            for subreddit, post_id in query.yield_per(10000):
+                cache.add(subreddit + "/" + post_id)
+            kind = "Bloom filter"
+
+        self.cache = cache
+        print(
+            "Loaded {} known posts into a {} using about {} KiB.".format(
+                count, kind, self.memory_usage() // 1024
             )
-            .first()
         )
-        if post:
+
+    def reload(self):
+        """
+        Reloads the known posts from the database, like after old ones were pruned.
+        """
+        self.session.expire_all()
+        self._load_cache()
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the number of bytes used by the in-memory cache.
+
+        Returns
+        -------
+        int
+            The approximate size of the cache in bytes.
+        """
+        if isinstance(self.cache, BloomFilter):
+            return self.cache.memory_usage()
+
+        # subreddit names are interned, so they are shared between keys
+        subreddits = {subreddit for subreddit, _ in self.cache}
+        return (
+            sys.getsizeof(self.cache)
+            + sum(sys.getsizeof(key) + sys.getsizeof(key[1]) for key in self.cache)
+            + sum(sys.getsizeof(subreddit) for subreddit in subreddits)
+        )
+
+    def _in_memory(self, key: tuple) -> bool:
+        if isinstance(self.cache, BloomFilter):
+            return key[0] + "/" + key[1] in self.cache
+
+        return key in self.cache
+
+    def _remember(self, key: tuple):
+        if isinstance(self.cache, BloomFilter):
+            self.cache.add(key[0] + "/" + key[1])
+        else:
+            self.cache.add(key)
+
+    def _existing_keys(self, keys: list) -> set:
+        """
+        Finds which of the given keys are in the database, with one query per chunk.
+
+        Parameters
+        ----------
+        keys : list[tuple[str, str]]
+            The (subreddit, post_id) keys to look for.
+
+        Returns
+        -------
+        set[tuple[str, str]]
+            The keys that are in the database.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = set()
+        for start in range(0, len(keys), self.QUERY_CHUNK_SIZE):
+            chunk = keys[start : start + self.QUERY_CHUNK_SIZE]
+            rows = self.session.query(ClientPost.subreddit, ClientPost.post_id).filter(
+                ClientPost.username == self.username,
+                sqlalchemy.tuple_(ClientPost.subreddit, ClientPost.post_id).in_(chunk),
+            )
+            found.update((subreddit, post_id) for subreddit, post_id in rows)
+
+        return found
+
+    def check_post(self, submission):
+        key = self._key(submission)
+        if not self._in_memory(key):
+            return False
+
+        if isinstance(self.cache, set):
             return True
 
-        return False
+        # only a possible hit for the Bloom filter, so confirm it
+        return bool(self._existing_keys([key]))
 
     def check_posts(self, submissions: list):
-        result = []
-        for submission in submissions:
-            if not self.check_post(submission):
-                result.append(submission)
+        maybe_known = [
+            submission
+            for submission in submissions
+            if self._in_memory(self._key(submission))
+        ]
+        if isinstance(self.cache, set):
+            known = {self._key(submission) for submission in maybe_known}
+        else:
+            known = self._existing_keys(
+                [self._key(submission) for submission in maybe_known]
+            )
+
+        return [
+            submission
+            for submission in submissions
+            if self._key(submission) not in known
+        ]
 
-        return result
+    @staticmethod
+    def _created_utc(submission) -> datetime.datetime:
+        return datetime.datetime.utcfromtimestamp(submission.created_utc)
 
     def add_post(self, submission):
-        if not self.check_post(submission):
-            self.session.add(
-                ClientPost(
-                    self.username, submission.subreddit.display_name, submission.id
-                )
+        return bool(self.add_posts([submission]))
+
+    def add_posts(self, submissions: list) -> list:
+        added = []
+        added_keys = set()
+        for submission in self.check_posts(submissions):
+            key = self._key(submission)
+            if key in added_keys:
+                continue
+
+            added_keys.add(key)
+            added.append(submission)
+
+        # one executemany and one commit for the whole batch. Posts another cache on
+        # the same db file added in the meantime are skipped by the unique index
+        if added:
+            posted_at = datetime.datetime.utcnow()
+            self.session.execute(
+                sqlite.insert(ClientPost).on_conflict_do_nothing(),
+                [
+                    dict(
+                        username=self.username,
+                        subreddit=submission.subreddit.display_name,
+                        post_id=submission.id,
+                        created_utc=self._created_utc(submission),
+                        posted_at=posted_at,
+                    )
+                    for submission in added
+                ],
             )
             self.session.commit()
-            return True
 
-        return False
+        for key in added_keys:
+            self._remember(key)
+
+        return added
+
+    def claim_posts(self, submissions: list, lease: float = 300) -> tuple:
+        token = str(uuid.uuid4())
+        now = time.time()
+        self.claims = {
+            key: claim for key, claim in self.claims.items() if claim[1] > now
+        }
+
+        claimed = []
+        for submission in self.check_posts(submissions):
+            key = self._key(submission)
+            if key in self.claims:
+                continue
+
+            self.claims[key] = (token, now + lease)
+            claimed.append(submission)
+
+        return token, claimed
+
+    def commit_claim(self, token: str, submissions: list) -> list:
+        keys = [self._key(submission) for submission in submissions]
+        held = [self.claims.get(key, (None,))[0] == token for key in keys]
+        if not all(held):
+            # the same as the RESTCache, the posts were crossposted either way, so
+            # they're added without the claims
+            print("Claims were lost before they were committed, adding the posts.")
+        added = self.add_posts(submissions)
+        for key, is_held in zip(keys, held):
+            if is_held:
+                del self.claims[key]
+
+        return added
+
+    def release_claim(self, token: str, submissions: list = None):
+        if submissions is None:
+            keys = list(self.claims)
+        else:
+            keys = [self._key(submission) for submission in submissions]
 
-    def add_posts(self, submissions: list):
-        for submission in submissions:
-            self.add_post(submission)
+        for key in keys:
+            if self.claims.get(key, (None,))[0] == token:
+                del self.claims[key]
@@ -1,7 +1,13 @@
 from .base_cache import BaseCache
 from functools import wraps
 from urllib.parse import urljoin
+import base64
+import json
+import os
+import socket
+import time
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class RESTCache(BaseCache):
@@ -15,16 +21,155 @@ class RESTCache(BaseCache):
         The meta class for caches.
     """
 
-    def __init__(self, username: str, password: str, url: str):
+    DATABASE_FOLDER = "/database_folder/"
+    # how long before the token's expiry it should be refreshed, in seconds
+    TOKEN_REFRESH_MARGIN = 60
+    # sessions by server url, so caches for different users share connections
+    sessions = {}
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        url: str,
+        worker_id: str = "",
+        api_key: str = "",
+        api_key_filename: str = "",
+    ):
         self.username = username
         self.password = password
         self.url = url
+        # where a key made by logging in with the password is kept, so later runs reuse
+        # it instead of each leaving another key behind on the server
+        self.api_key_path = self.DATABASE_FOLDER + (
+            api_key_filename or "{}.api_key".format(username)
+        )
+        # exchanged for tokens instead of the password, which the server checks with a
+        # slow hash
+        self.api_key = api_key or self.load_api_key(self.api_key_path)
+        # identifies this client among the user's workers when sharding
+        self.worker_id = worker_id or socket.gethostname()
         self.token_header = None
+        self.token_expiry = 0
+        # one pooled keep-alive session, so calls don't each open a new connection
+        if url not in self.sessions:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=4))
+            session.mount("https://", HTTPAdapter(pool_maxsize=4))
+            self.sessions[url] = session
+        self.session = self.sessions[url]
+
+    @staticmethod
+    def token_expiry_time(token: str) -> float:
+        """
+        Reads the expiry time out of a JWT. The signature isn't checked, since the token
+        came straight from the server and only the server verifies it.
+
+        Parameters
+        ----------
+        token : str
+            The JWT to read.
+
+        Returns
+        -------
+        float
+            The token's 'exp' claim as a Unix timestamp, or 0 if it doesn't have one.
+        """
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload)).get("exp", 0))
+
+    @staticmethod
+    def load_api_key(path: str) -> str:
+        """
+        Reads an API key saved by an earlier run.
+
+        Parameters
+        ----------
+        path : str
+            The file the key was saved to.
+
+        Returns
+        -------
+        str
+            The key, or an empty string if none was saved.
+        """
+        try:
+            with open(path) as key_file:
+                return key_file.read().strip()
+        except OSError:
+            return ""
+
+    @staticmethod
+    def save_api_key(path: str, api_key: str):
+        """
+        Saves an API key for later runs, readable only by this user.
+
+        Parameters
+        ----------
+        path : str
+            The file to save the key to.
+        api_key : str
+            The key.
+        """
+        temporary_path = path + ".tmp"
+        try:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+            with open(os.open(temporary_path, flags, 0o600), "w") as key_file:
+                key_file.write(api_key)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            print("Error saving the API key, a new one is made next run: {}".format(e))
+
+    def set_token(self, token: str):
+        self.token_header = {"Authorization": "Bearer {}".format(token)}
+        self.token_expiry = self.token_expiry_time(token)
+
+    def login(self):
+        """
+        Gets a token to use for later requests, by exchanging the API key for one. If
+        there's no API key yet, or it was revoked, logs in with the password once and
+        makes a new key for later logins, which is saved for later runs too.
+
+        Raises
+        ------
+        RuntimeError
+            If the server turns the API key or password down.
+        requests.RequestException
+            If the server can't be reached or has an error of its own.
+        """
+        if self.api_key:
+            token_url = urljoin(self.url, "users/token")
+            resp = self.session.post(token_url, json={"api_key": self.api_key})
+            if resp.status_code <= 299:
+                self.set_token(resp.json()["token"])
+                return
+            if resp.status_code >= 500:
+                resp.raise_for_status()
+
+            if not self.password:
+                raise RuntimeError("Error with logging in, check the api_key!")
+
+        login_url = urljoin(self.url, "users/login")
+        resp = self.session.get(login_url, auth=(self.username, self.password))
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+        if resp.status_code > 299:
+            raise RuntimeError("Error with logging in!")
+        self.set_token(resp.json()["token"])
+
+        resp = self.session.post(
+            urljoin(self.url, "users/api_keys"), headers=self.token_header
+        )
+        if resp.status_code <= 299:
+            self.api_key = resp.json()["api_key"]
+            self.save_api_key(self.api_key_path, self.api_key)
 
     def need_token(f):
         """
-        A decorator for when certain actions require a token. Sets self.header_token to
-        the necessary token, and sets it to none after the function is complete.
+        A decorator for when certain actions require a token. Makes sure
+        self.token_header holds a token that isn't about to expire, logging in again
+        only when it is.
 
         Parameters
         ----------
@@ -40,21 +185,42 @@ class RESTCache(BaseCache):
 
         @wraps(f)
         def decorator(self, *args, **kwargs):
-            login_url = urljoin(self.url, "users/login")
-            resp = requests.get(login_url, auth=(self.username, self.password))
-            if resp.status_code > 299:
-                print("Error with logging in!")
-                exit()
-
-            token = resp.json()["token"]
-            self.token_header = {"Authorization": "Bearer {}".format(token)}
-            func = f(self, *args, **kwargs)
-            # unset so it is retrieved again
-            self.token_header = None
-            return func
+            if (
+                self.token_header is None
+                or time.time() > self.token_expiry - self.TOKEN_REFRESH_MARGIN
+            ):
+                self.login()
+
+            return f(self, *args, **kwargs)
 
         return decorator
 
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends an authorized request through the pooled session, logging in again and
+        retrying once if the server rejects the token.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method to use.
+        url : str
+            The url to send the request to.
+
+        Returns
+        -------
+        requests.Response
+            The server's response.
+        """
+        resp = self.session.request(method, url, headers=self.token_header, **kwargs)
+        if resp.status_code == 401:
+            self.login()
+            resp = self.session.request(
+                method, url, headers=self.token_header, **kwargs
+            )
+
+        return resp
+
     @need_token
     def check_posts(self, submissions: list):
         contains_url = urljoin(self.url, "posts/")
@@ -68,7 +234,7 @@ class RESTCache(BaseCache):
             )
         posts_dict = {"posts": posts}
 
-        resp = requests.get(contains_url, headers=self.token_header, json=posts_dict)
+        resp = self.request("GET", contains_url, json=posts_dict)
 
         good_posts = []
         for post in resp.json()["posts"]:
@@ -93,20 +259,116 @@ class RESTCache(BaseCache):
                 "post_id": submission.id,
             }
         }
-        resp = requests.get(contains_url, headers=self.token_header, json=post_dict)
+        resp = self.request("GET", contains_url, json=post_dict)
         return resp.json()["exists"]
 
     @need_token
     def add_post(self, submission):
         add_url = urljoin(self.url, "posts/")
-        post_dict = {
-            "post": {
+        post_dict = {"post": self.post_dicts([submission])[0]}
+        resp = self.request("POST", add_url, json=post_dict)
+        return not resp.json()["exists"]
+
+    @need_token
+    def add_posts(self, submissions: list) -> list:
+        if not submissions:
+            return []
+
+        add_url = urljoin(self.url, "posts/")
+        posts_dict = {"posts": self.post_dicts(submissions)}
+        resp = self.request("POST", add_url, json=posts_dict)
+
+        # the server answers in the same order the posts were sent
+        return [
+            submission
+            for submission, post in zip(submissions, resp.json())
+            if not post["exists"]
+        ]
+
+    @staticmethod
+    def post_dicts(submissions: list) -> list:
+        return [
+            {
                 "subreddit": submission.subreddit.display_name,
                 "post_id": submission.id,
+                "created_utc": submission.created_utc,
             }
+            for submission in submissions
+        ]
+
+    @need_token
+    def claim_posts(self, submissions: list, lease: float = 300) -> tuple:
+        claim_url = urljoin(self.url, "posts/claim")
+        claim_dict = {
+            "worker": self.worker_id,
+            "lease": lease,
+            "posts": self.post_dicts(submissions),
         }
-        resp = requests.post(add_url, headers=self.token_header, json=post_dict)
-        return not resp.json()["exists"]
+        resp = self.request("POST", claim_url, json=claim_dict)
+        result = resp.json()
+
+        # the server answers in the same order the posts were sent
+        return result["token"], [
+            submission
+            for submission, post in zip(submissions, result["posts"])
+            if post["claimed"]
+        ]
 
-    def add_posts(self, submission):
-        pass
+    @need_token
+    def commit_claim(self, token: str, submissions: list) -> list:
+        if not submissions:
+            return []
+
+        commit_url = urljoin(self.url, "posts/claim/{}/commit".format(token))
+        resp = self.request(
+            "POST", commit_url, json={"posts": self.post_dicts(submissions)}
+        )
+        if resp.status_code in (404, 409):
+            # the claims ran out and were taken over or cleaned up, but the posts were
+            # crossposted either way, so they're added without them
+            print("Claims were lost before they were committed, adding the posts.")
+            return self.add_posts(submissions)
+        resp.raise_for_status()
+
+        return [
+            submission
+            for submission, post in zip(submissions, resp.json())
+            if not post["exists"]
+        ]
+
+    @need_token
+    def release_claim(self, token: str, submissions: list = None):
+        release_url = urljoin(self.url, "posts/claim/{}/release".format(token))
+        release_dict = {}
+        if submissions is not None:
+            release_dict["posts"] = self.post_dicts(submissions)
+        self.request("POST", release_url, json=release_dict)
+
+    @need_token
+    def heartbeat(self, ttl: float) -> list:
+        """
+        Tells the server this worker is live, for the next ttl seconds.
+
+        Parameters
+        ----------
+        ttl : float
+            How long the worker counts as live without another heartbeat, in seconds.
+
+        Returns
+        -------
+        list[str]
+            The ids of the user's live workers, including this one.
+        """
+        heartbeat_url = urljoin(self.url, "workers/heartbeat")
+        resp = self.request(
+            "POST", heartbeat_url, json={"worker": self.worker_id, "ttl": ttl}
+        )
+        return resp.json()["workers"]
+
+    @need_token
+    def leave(self):
+        """
+        Tells the server this worker is shutting down, so its share of the subreddits
+        is handed to the other workers straight away.
+        """
+        self.request("DELETE", urljoin(self.url, "workers/" + self.worker_id))
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, MetaData
+from sqlalchemy import Column, DateTime, Index, Integer, String, MetaData
 from base import Base
+import datetime
 
 
 class ClientPost(Base):
@@ -13,12 +14,41 @@ class ClientPost(Base):
     """
 
     __tablename__ = "posts"
+    __table_args__ = (
+        Index(
+            "ix_posts_username_subreddit_post_id",
+            "username",
+            "subreddit",
+            "post_id",
+            unique=True,
+        ),
+        Index(
+            "ix_posts_username_subreddit_created_utc",
+            "username",
+            "subreddit",
+            "created_utc",
+        ),
+        Index("ix_posts_posted_at", "posted_at"),
+    )
     id = Column(Integer, primary_key=True)
     username = Column(String(255), nullable=False)
     subreddit = Column(String(255), nullable=False)
     post_id = Column(String(255), nullable=False)
+    # when the post was made on Reddit, unknown for posts added by older versions
+    created_utc = Column(DateTime)
+    # when the post was crossposted, set to the upgrade time for posts from before it
+    posted_at = Column(DateTime)
 
-    def __init__(self, username: str, subreddit: str, post_id: str):
+    def __init__(
+        self,
+        username: str,
+        subreddit: str,
+        post_id: str,
+        created_utc: datetime.datetime = None,
+        posted_at: datetime.datetime = None,
+    ):
         self.username = username
         self.subreddit = subreddit
         self.post_id = post_id
+        self.created_utc = created_utc
+        self.posted_at = posted_at
@@ -1,6 +1,197 @@
 from caches import Cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from delivery_scheduler import DeliveryScheduler
+import discord
 import requests
+import time
 from discord import SyncWebhook
+from subreddit_post_gatherer import SubredditPostGatherer
+
+
+def format_message(submission, reddit_config_url: str) -> str:
+    """
+    Builds the Discord message for a submission.
+
+    Parameters
+    ----------
+    submission : Any
+        The Reddit submission to be posted to Discord.
+    reddit_config_url : str
+        What URL to use for Reddit.
+
+    Returns
+    -------
+    str
+        The message to send.
+    """
+    submission_url = reddit_config_url + submission.permalink
+    post_url = submission.url
+    if (
+        "crosspost_parent" in vars(submission)
+        and not r"redd.it" in submission.url
+        and not r"http" in submission.url
+    ):
+        print("CROSSPOSTED!")
+        post_url = reddit_config_url + submission.url
+
+    if submission_url == post_url:
+        post_url = ""
+
+    return "{} by {}:\n{}\n{}".format(
+        submission.title,
+        submission.author,
+        submission_url,
+        post_url,
+    )
+
+
+class DeliveryTracker:
+    """
+    Remembers which webhooks submissions have already been sent to, for submissions
+    that haven't reached every webhook and been recorded yet. A submission that only
+    reached some webhooks in a partly failed attempt is then only sent to the rest when
+    it's tried again, instead of showing up twice on the ones it reached.
+
+    Submissions that didn't reach a webhook also hold back newer ones from it until
+    they're retried and get through, so a webhook that comes back after failing still
+    gets everything in order. Ones that aren't retried within HOLD_TIMEOUT, because
+    they were removed or recorded elsewhere in the meantime, stop holding others back.
+
+    Parameters
+    ----------
+    webhook_urls : list[str]
+        The webhooks submissions are sent to.
+    """
+
+    # the most partially delivered submissions whose per-webhook state is remembered
+    MAX_TRACKED_SUBMISSIONS = 10000
+    # how long a submission that didn't reach a webhook holds newer ones back from it
+    # without being tried again, in seconds
+    HOLD_TIMEOUT = 10 * 60
+
+    def __init__(self, webhook_urls: list):
+        self.webhook_urls = webhook_urls
+        # (subreddit, post id) -> the webhook urls it has already been sent to
+        self.delivered_to = OrderedDict()
+        # webhook url -> (subreddit, post id) -> (sort key, when it was last tried) of
+        # the submissions that didn't reach it
+        self.behind = {webhook_url: OrderedDict() for webhook_url in webhook_urls}
+
+    @staticmethod
+    def _key(submission) -> tuple:
+        return (submission.subreddit.display_name, submission.id)
+
+    def _expire(self, now: float):
+        for behind in self.behind.values():
+            while behind and next(iter(behind.values()))[1] < now - self.HOLD_TIMEOUT:
+                behind.popitem(last=False)
+
+    def pending(self, submissions: list) -> dict:
+        """
+        Works out which submissions still have to be sent to each webhook.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to send, oldest first.
+
+        Returns
+        -------
+        dict[str, list[int]]
+            The indexes of the submissions each webhook hasn't been sent yet and isn't
+            holding back for older ones, in order.
+        """
+        self._expire(time.time())
+        keys = [self._key(submission) for submission in submissions]
+        orders = [
+            SubredditPostGatherer.oldest_first(submission) for submission in submissions
+        ]
+        batch = set(keys)
+        pending = {}
+        for webhook_url in self.webhook_urls:
+            # the oldest submission this webhook is still waiting for that isn't here
+            waiting_for = min(
+                (
+                    order
+                    for key, (order, _) in self.behind[webhook_url].items()
+                    if key not in batch
+                ),
+                default=None,
+            )
+            pending[webhook_url] = [
+                index
+                for index, key in enumerate(keys)
+                if webhook_url not in self.delivered_to.get(key, ())
+                and (waiting_for is None or orders[index] < waiting_for)
+            ]
+
+        return pending
+
+    def mark_sent(self, webhook_url: str, submissions: list):
+        """
+        Remembers that submissions were sent to a webhook.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook they were sent to.
+        submissions : list
+            The submissions that were sent.
+        """
+        for submission in submissions:
+            key = self._key(submission)
+            self.delivered_to.setdefault(key, set()).add(webhook_url)
+            self.delivered_to.move_to_end(key)
+            self.behind[webhook_url].pop(key, None)
+
+        while len(self.delivered_to) > self.MAX_TRACKED_SUBMISSIONS:
+            self.delivered_to.popitem(last=False)
+
+    def hold(self, submissions: list):
+        """
+        Remembers which webhooks submissions didn't reach after an attempt, so newer
+        submissions are held back from those webhooks until they do.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions that were just attempted.
+        """
+        now = time.time()
+        for submission in submissions:
+            key = self._key(submission)
+            order = SubredditPostGatherer.oldest_first(submission)
+            for webhook_url in self.webhook_urls:
+                if webhook_url in self.delivered_to.get(key, ()):
+                    continue
+                behind = self.behind[webhook_url]
+                behind.pop(key, None)
+                behind[key] = (order, now)
+                while len(behind) > self.MAX_TRACKED_SUBMISSIONS:
+                    behind.popitem(last=False)
+
+    def delivered(self, submissions: list) -> list:
+        """
+        Returns the submissions that have been sent to every webhook, in order.
+        """
+        webhook_urls = set(self.webhook_urls)
+        return [
+            submission
+            for submission in submissions
+            if webhook_urls <= self.delivered_to.get(self._key(submission), set())
+        ]
+
+    def forget(self, submissions: list):
+        """
+        Stops tracking submissions, once they've been recorded in the cache or won't be
+        delivered after all.
+        """
+        for submission in submissions:
+            key = self._key(submission)
+            self.delivered_to.pop(key, None)
+            for behind in self.behind.values():
+                behind.pop(key, None)
 
 
 class CrossPoster:
@@ -11,7 +202,10 @@ class CrossPoster:
         webhook_urls: list,
         username: str,
         avatar_url: str,
-        reddit_config_url: str
+        reddit_config_url: str,
+        max_concurrent_webhooks: int = 4,
+        scheduler: DeliveryScheduler = None,
+        executor: ThreadPoolExecutor = None
     ):
         """
         An object for crossposting Reddit posts to Discord.
@@ -29,66 +223,167 @@ class CrossPoster:
             The URL for the avatar to use for the user when posting to Discord.
         reddit_config_url : str
             What URL to use for Reddit.
+        max_concurrent_webhooks : int
+            The most webhooks that are sent to at the same time.
+        scheduler : DeliveryScheduler, optional
+            The scheduler to pace sends with, for sharing rate limits and connections
+            between crossposters. One is made if not given.
+        executor : ThreadPoolExecutor, optional
+            The pool to send to webhooks on, for sharing between crossposters. One
+            with max_concurrent_webhooks workers is made if not given.
         """
         self.cache = cache
         self.avatar_url = avatar_url
         self.username = username
         self.webhook_urls = webhook_urls
         self.reddit_config_url = reddit_config_url
-        """
-
-        Args:
-            submission (submission): 
-        """
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max(max_concurrent_webhooks, 1)
+        )
+        self.scheduler = scheduler or DeliveryScheduler()
+        # each webhook is only ever sent to by one worker at a time, so each gets its
+        # own keep-alive session, which also feeds its rate limits to the scheduler
+        self.sessions = {
+            webhook_url: self.scheduler.session_for(webhook_url)
+            for webhook_url in self.webhook_urls
+        }
+        self.tracker = DeliveryTracker(self.webhook_urls)
 
-    def post_submission(self, submission):
+    def format_message(self, submission) -> str:
         """
-        Posts a submission from PRAW to all webhook urls this crossposter has.
+        Builds the Discord message for a submission.
 
         Parameters
         ----------
         submission : Any
             The Reddit submission to be posted to Discord.
+
+        Returns
+        -------
+        str
+            The message to send.
         """
-        with requests.Session() as session:
-            for webhook_url in self.webhook_urls:
-                webhook = SyncWebhook.from_url(
-                    webhook_url,
-                    session=session,
-                )
+        return format_message(submission, self.reddit_config_url)
 
-                submission_url = self.reddit_config_url + submission.permalink
-                post_url = submission.url
-                if (
-                    "crosspost_parent" in vars(submission)
-                    and not r"redd.it" in submission.url
-                    and not r"http" in submission.url
-                ):
-                    print("CROSSPOSTED!")
-                    post_url = self.reddit_config_url + submission.url
-
-                if submission_url == post_url:
-                    post_url = ""
-
-                webhook_message = "{} by {}:\n{}\n{}".format(
-                    submission.title,
-                    submission.author,
-                    submission_url,
-                    post_url,
-                )
+    def send_to_webhook(self, webhook_url: str, messages: list) -> int:
+        """
+        Sends messages to one webhook in order, stopping at the first failure so that
+        nothing is posted out of order. Each send waits for the scheduler, so the
+        webhook's rate limit is never exceeded.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook to send to.
+        messages : list[str]
+            The messages to send, oldest first.
+
+        Returns
+        -------
+        int
+            How many of the messages were sent.
+        """
+        webhook = SyncWebhook.from_url(
+            webhook_url,
+            session=self.sessions[webhook_url],
+        )
+        self.scheduler.enqueue(webhook_url, len(messages))
+        for sent, message in enumerate(messages):
+            self.scheduler.acquire(webhook_url)
+            try:
                 webhook.send(
-                    webhook_message,
+                    message,
                     username=self.username,
                     avatar_url=self.avatar_url,
                 )
+            except (discord.DiscordException, requests.RequestException) as e:
+                print("Error sending to webhook, will retry later: {}".format(e))
+                self.scheduler.dequeue(webhook_url, len(messages) - sent)
+                return sent
+            self.scheduler.dequeue(webhook_url)
+
+        return len(messages)
 
-                # if there's a runtime error, this update should only happen afterwards.
-                success = self.cache.add_post(submission)
-                if not success:
-                    print(
-                        "Already exists: User: {} Subreddit: {} Post_id: {}".format(
-                            self.cache.username,
-                            submission.subreddit.display_name,
-                            submission.id,
-                        )
+    def post_submissions(self, submissions: list) -> list:
+        """
+        Posts submissions from PRAW to all webhook urls this crossposter has. Webhooks
+        are sent to concurrently, but each webhook gets the submissions in the order
+        given. A submission that already reached some webhooks in an earlier, partly
+        failed attempt is only sent to the webhooks it hasn't reached yet, and newer
+        submissions are held back from a webhook while older ones are waiting to be
+        retried on it.
+
+        Parameters
+        ----------
+        submissions : list
+            The Reddit submissions to be posted to Discord, oldest first.
+
+        Returns
+        -------
+        list
+            The submissions that have now been posted to every webhook.
+        """
+        messages = [self.format_message(submission) for submission in submissions]
+        pending = self.tracker.pending(submissions)
+        sent_counts = self.executor.map(
+            lambda webhook_url: self.send_to_webhook(
+                webhook_url, [messages[index] for index in pending[webhook_url]]
+            ),
+            self.webhook_urls,
+        )
+
+        for webhook_url, sent in zip(self.webhook_urls, sent_counts):
+            self.tracker.mark_sent(
+                webhook_url,
+                [submissions[index] for index in pending[webhook_url][:sent]],
+            )
+        self.tracker.hold(submissions)
+
+        return self.tracker.delivered(submissions)
+
+    def post_submission(self, submission) -> bool:
+        """
+        Posts a submission from PRAW to all webhook urls this crossposter has.
+
+        Parameters
+        ----------
+        submission : Any
+            The Reddit submission to be posted to Discord.
+
+        Returns
+        -------
+        bool
+            True if the submission was posted to every webhook.
+        """
+        return bool(self.post_submissions([submission]))
+
+    def record_submissions(self, submissions: list, token: str = None):
+        """
+        Records submissions that were posted to Discord in the cache, in one batch.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions that were successfully posted to every webhook.
+        token : str, optional
+            The claim token the submissions were claimed under, if they were claimed.
+        """
+        if token is None:
+            added = self.cache.add_posts(submissions)
+        else:
+            added = self.cache.commit_claim(token, submissions)
+        self.tracker.forget(submissions)
+
+        if len(added) == len(submissions):
+            return
+
+        added_ids = {id(submission) for submission in added}
+        for submission in submissions:
+            if id(submission) not in added_ids:
+                print(
+                    "Already exists: User: {} Subreddit: {} Post_id: {}".format(
+                        self.cache.username,
+                        submission.subreddit.display_name,
+                        submission.id,
                     )
+                )
@@ -0,0 +1,84 @@
+import heapq
+
+
+class DelayQueue:
+    """
+    A min-heap of items keyed on the time they become due, so the next item to come due
+    can be found without scanning everything that's waiting.
+    """
+
+    def __init__(self, entries: list = ()):
+        """
+        Initializer for DelayQueue.
+
+        Parameters
+        ----------
+        entries : list[tuple], optional
+            (due, key, item) entries to start with, like ones saved from entries().
+        """
+        self.heap = []
+        self.keys = set()
+        for due, key, item in entries:
+            self.push(due, key, item)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys
+
+    def push(self, due: float, key, item):
+        """
+        Adds an item to the queue, unless an item with the same key is already waiting.
+
+        Parameters
+        ----------
+        due : float
+            The Unix timestamp the item becomes due at.
+        key : Any
+            A unique, comparable key for the item.
+        item : Any
+            The item.
+        """
+        if key in self.keys:
+            return
+
+        heapq.heappush(self.heap, (due, key, item))
+        self.keys.add(key)
+
+    def pop_due(self, now: float) -> list:
+        """
+        Removes and returns every item that is due.
+
+        Parameters
+        ----------
+        now : float
+            The current Unix timestamp.
+
+        Returns
+        -------
+        list[tuple]
+            The (due, key, item) entries that are due, earliest first.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            self.keys.discard(entry[1])
+            due.append(entry)
+
+        return due
+
+    def next_due(self):
+        """
+        Returns when the next item becomes due, or None if the queue is empty.
+        """
+        if not self.heap:
+            return None
+
+        return self.heap[0][0]
+
+    def entries(self) -> list:
+        """
+        Returns every (due, key, item) entry, in no particular order.
+        """
+        return list(self.heap)
@@ -0,0 +1,198 @@
+import threading
+import time
+import requests
+
+
+class TokenBucket:
+    """
+    Tracks one Discord rate limit bucket. Discord hands out a number of requests per
+    window, and reports how many are left and when the window resets in the
+    X-RateLimit-* headers of every response, which are used to keep this in sync.
+
+    Parameters
+    ----------
+    limit : int
+        The number of requests allowed per window, until Discord says otherwise.
+    period : float
+        The length of a window in seconds, until Discord says otherwise.
+    """
+
+    def __init__(self, limit: int = 5, period: float = 2.0):
+        self.limit = limit
+        self.period = period
+        self.remaining = limit
+        self.reset_at = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a request from the bucket.
+
+        Returns
+        -------
+        float
+            How many seconds to wait before the reserved request may be sent.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + self.period
+
+            if self.remaining > 0:
+                self.remaining -= 1
+                return 0.0
+
+            # the request goes out at the start of the next window
+            wait = self.reset_at - now
+            self.reset_at += self.period
+            self.remaining = self.limit - 1
+            return wait
+
+    def update(self, headers):
+        """
+        Updates the bucket from a Discord response's headers.
+
+        Parameters
+        ----------
+        headers : Mapping[str, str]
+            The response headers.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Reset-After" in headers:
+                reset_after = float(headers["X-RateLimit-Reset-After"])
+                self.reset_at = now + reset_after
+                self.period = max(self.period, reset_after)
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "Retry-After" in headers:
+                self.remaining = 0
+                self.reset_at = max(self.reset_at, now + float(headers["Retry-After"]))
+
+
+class DeliveryScheduler:
+    """
+    Paces messages to Discord webhooks so that no webhook goes over its rate limit, with
+    a token bucket per webhook url. Also keeps track of how many messages are queued
+    for each webhook and how long sending has had to wait.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.queued = {}
+        self.total_wait = {}
+        self.max_wait = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, webhook_url: str) -> TokenBucket:
+        with self.lock:
+            if webhook_url not in self.buckets:
+                self.buckets[webhook_url] = TokenBucket()
+                self.queued[webhook_url] = 0
+                self.total_wait[webhook_url] = 0.0
+                self.max_wait[webhook_url] = 0.0
+
+            return self.buckets[webhook_url]
+
+    def session_for(self, webhook_url: str) -> requests.Session:
+        """
+        Returns the webhook's session, whose responses update its rate limit bucket.
+        The session is made the first time and shared after that.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook the session will be used for.
+
+        Returns
+        -------
+        requests.Session
+            The session to send to the webhook with.
+        """
+        bucket = self._bucket(webhook_url)
+        with self.lock:
+            if webhook_url not in self.sessions:
+                session = requests.Session()
+                session.hooks["response"].append(
+                    lambda response, *args, **kwargs: bucket.update(response.headers)
+                )
+                self.sessions[webhook_url] = session
+
+            return self.sessions[webhook_url]
+
+    def enqueue(self, webhook_url: str, count: int = 1):
+        """
+        Notes that messages are waiting to be sent to a webhook.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook the messages are for.
+        count : int
+            The number of messages.
+        """
+        self._bucket(webhook_url)
+        with self.lock:
+            self.queued[webhook_url] += count
+
+    def dequeue(self, webhook_url: str, count: int = 1):
+        """
+        Notes that messages for a webhook were sent or dropped.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook the messages were for.
+        count : int
+            The number of messages.
+        """
+        with self.lock:
+            self.queued[webhook_url] = max(self.queued[webhook_url] - count, 0)
+
+    def acquire(self, webhook_url: str) -> float:
+        """
+        Blocks until a message may be sent to a webhook without going over its rate
+        limit.
+
+        Parameters
+        ----------
+        webhook_url : str
+            The webhook to send to.
+
+        Returns
+        -------
+        float
+            How many seconds were spent waiting.
+        """
+        wait = self._bucket(webhook_url).reserve()
+        if wait > 0:
+            time.sleep(wait)
+            with self.lock:
+                self.total_wait[webhook_url] += wait
+                self.max_wait[webhook_url] = max(self.max_wait[webhook_url], wait)
+
+        return wait
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth and wait times for each webhook.
+
+        Returns
+        -------
+        dict[str, dict]
+            For each webhook url, the number of 'queued' messages, and the
+            'total_wait' and 'max_wait' in seconds.
+        """
+        with self.lock:
+            return {
+                webhook_url: {
+                    "queued": self.queued[webhook_url],
+                    "total_wait": self.total_wait[webhook_url],
+                    "max_wait": self.max_wait[webhook_url],
+                }
+                for webhook_url in self.buckets
+            }
@@ -0,0 +1,55 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """
+    A consistent hash ring, for dividing keys (like subreddit names) between nodes
+    (like workers). Every node is placed on the ring at several points, and a key
+    belongs to the first node point at or after its own hash. When a node joins or
+    leaves, only the keys next to its points move, the rest stay where they were.
+
+    Parameters
+    ----------
+    nodes : Iterable[str]
+        The nodes on the ring.
+    replicas : int
+        How many points each node gets, more spread the keys more evenly.
+    """
+
+    def __init__(self, nodes, replicas: int = 64):
+        self.nodes = sorted(set(nodes))
+        self.replicas = replicas
+        points = sorted(
+            (self._hash("{}#{}".format(node, replica)), node)
+            for node in self.nodes
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(
+            hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+
+    def node_for(self, key: str) -> str:
+        """
+        Returns the node a key belongs to.
+
+        Parameters
+        ----------
+        key : str
+            The key to look up.
+
+        Returns
+        -------
+        str
+            The node, or None if the ring is empty.
+        """
+        if not self.hashes:
+            return None
+
+        index = bisect.bisect_left(self.hashes, self._hash(key))
+        return self.owners[index % len(self.owners)]
@@ -4,50 +4,541 @@ import configparser
 import time
 from datetime import datetime
 
+from concurrent.futures import ThreadPoolExecutor
+
 from caches import Cache
 
 from cross_poster import CrossPoster
+from delivery_scheduler import DeliveryScheduler
+from retention import RetentionJob
+from caches.local_cache import LocalCache
+from caches.rest_cache import RESTCache
+from shard_coordinator import ShardCoordinator
 from subreddit_post_gatherer import SubredditPostGatherer
 import os
+import traceback
+import requests
 
 CONFIG_FILE = os.path.expanduser("~/.config/config.ini")
+DATABASE_FOLDER = "/database_folder/"
+# how long a feed that raised is left alone, doubling for each failure in a row up to
+# the max, in seconds
+FAILURE_BACKOFF = 30
+MAX_FAILURE_BACKOFF = 30 * 60
+# how many times delivered posts are committed to the cache before they're requeued,
+# and the wait before the first retry, doubling after that, in seconds
+RECORD_ATTEMPTS = 3
+RECORD_RETRY_DELAY = 2
 import praw
 
 
-def main():
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
-    webhook_urls = [
-        webhook_url.strip()
-        for webhook_url in config["xposter"]["webhook_urls"].split(",")
+def subreddit_overrides(config: configparser.ConfigParser, option: str) -> dict:
+    """
+    Collects per-subreddit overrides of an xposter option from [subreddit:<name>]
+    sections.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        The parsed config.
+    option : str
+        The option to collect, like post_limit or wait_period.
+
+    Returns
+    -------
+    dict[str, int]
+        The overridden values, by subreddit name.
+    """
+    overrides = {}
+    for section in config.sections():
+        if section.startswith("subreddit:") and option in config[section]:
+            overrides[section[len("subreddit:") :]] = int(config[section][option])
+
+    return overrides
+
+
+def release_claim(cache, token: str, submissions: list = None):
+    """
+    Gives up claimed posts, or whatever is still claimed under a token, for this or
+    another client to claim again. If the server can't be reached the claims just run
+    out.
+    """
+    try:
+        cache.release_claim(token, submissions)
+    except requests.RequestException as e:
+        print("Error releasing claimed posts: {}".format(e))
+
+
+def record(cross_poster: CrossPoster, submissions: list, token: str) -> bool:
+    """
+    Commits delivered posts to the cache, trying a few times if the server can't be
+    reached.
+
+    Returns
+    -------
+    bool
+        True if the posts were recorded.
+    """
+    for attempt in range(RECORD_ATTEMPTS):
+        if attempt:
+            time.sleep(RECORD_RETRY_DELAY * 2 ** (attempt - 1))
+        try:
+            cross_poster.record_submissions(submissions, token)
+            return True
+        except requests.RequestException as e:
+            print(
+                "Error recording posts (attempt {} of {}): {}".format(
+                    attempt + 1, RECORD_ATTEMPTS, e
+                )
+            )
+
+    return False
+
+
+def deliver(
+    cross_poster: CrossPoster,
+    subreddit_gatherer: SubredditPostGatherer,
+    posts: list,
+    claim_lease: float = 300,
+):
+    """
+    Crossposts the gathered posts that aren't in the cache yet and weren't removed in
+    the meantime, and records the ones that were delivered. Posts are checked and
+    claimed in one step first, so another client sharing the cache leaves them alone,
+    and ones already claimed by another client are left to it.
+
+    Parameters
+    ----------
+    cross_poster : CrossPoster
+        The crossposter to deliver with.
+    subreddit_gatherer : SubredditPostGatherer
+        The gatherer the posts came from, which gets back any that couldn't be
+        delivered.
+    posts : list
+        The gathered submissions, oldest first.
+    claim_lease : float
+        How long the posts stay claimed if they're neither recorded nor released, in
+        seconds.
+    """
+    cache = cross_poster.cache
+    try:
+        token, claimed = cache.claim_posts(posts, claim_lease)
+    except requests.RequestException as e:
+        print("Error claiming posts, trying again in a bit: {}".format(e))
+        subreddit_gatherer.requeue(posts)
+        subreddit_gatherer.save_state()
+        return
+
+    try:
+        deliver_claimed(cross_poster, subreddit_gatherer, posts, token, claimed)
+    except Exception:
+        # the posts are put back by the caller, and would be skipped until the lease
+        # ran out if they were still claimed
+        release_claim(cache, token)
+        raise
+
+
+def deliver_claimed(
+    cross_poster: CrossPoster,
+    subreddit_gatherer: SubredditPostGatherer,
+    posts: list,
+    token: str,
+    claimed: list,
+):
+    """
+    The part of deliver() after the posts are claimed, which validates, crossposts and
+    records the claimed posts, and releases the ones that weren't delivered.
+
+    Parameters
+    ----------
+    cross_poster : CrossPoster
+        The crossposter to deliver with.
+    subreddit_gatherer : SubredditPostGatherer
+        The gatherer the posts came from.
+    posts : list
+        The gathered submissions, oldest first.
+    token : str
+        The claim token the posts were claimed under.
+    claimed : list
+        The submissions that were claimed, oldest first.
+    """
+    cache = cross_poster.cache
+    good_posts = subreddit_gatherer.guarded(
+        subreddit_gatherer.validator.validate, claimed
+    )
+    if good_posts is None:
+        # couldn't check them, so try again later rather than risk posting spam
+        release_claim(cache, token)
+        subreddit_gatherer.requeue(claimed)
+        subreddit_gatherer.save_state()
+        return
+    # ones that were recorded, claimed elsewhere or removed won't be retried, so they
+    # mustn't hold newer posts back from webhooks they didn't reach
+    good_ids = {id(submission) for submission in good_posts}
+    cross_poster.tracker.forget(
+        [submission for submission in posts if id(submission) not in good_ids]
+    )
+    print(
+        "Checked posts at: {} and found {} good posts.".format(
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(good_posts)
+        )
+    )
+
+    # recorded only once delivered, so a failed submission is retried later
+    delivered = cross_poster.post_submissions(good_posts)
+    recorded = bool(delivered) and record(cross_poster, delivered, token)
+    delivered_ids = {id(submission) for submission in delivered}
+    retry = [
+        submission
+        for submission in good_posts
+        if not recorded or id(submission) not in delivered_ids
     ]
-    reddit = praw.Reddit("xpost_bot", user_agent="xpost_bot v0.1")
-    cache = Cache(**config["cache"])
+    # posts that were delivered but not recorded stay claimed, and the crossposter
+    # remembers they were delivered, so the retry only records them
+    subreddit_gatherer.requeue(retry)
+    subreddit_gatherer.save_state()
+    # removed and undelivered posts are still claimed
+    delivered_names = {submission.fullname for submission in delivered}
+    unsent = [
+        submission
+        for submission in claimed
+        if submission.fullname not in delivered_names
+    ]
+    if unsent:
+        release_claim(cache, token, unsent)
+
+    rate_limited = sum(
+        stats["total_wait"] for stats in cross_poster.scheduler.stats().values()
+    )
+    if rate_limited:
+        print("Waited {:.1f}s for rate limits so far.".format(rate_limited))
+
+
+class Feed:
+    """
+    One subreddits to webhooks mapping, with its own cache user and timings. Several
+    feeds can be run in one process, sharing the Reddit client and connections.
+
+    Parameters
+    ----------
+    name : str
+        The feed's name, used when printing.
+    cross_poster : CrossPoster
+        The crossposter for the feed's webhooks and cache.
+    subreddit_gatherer : SubredditPostGatherer
+        The gatherer for the feed's subreddits.
+    wait_period : int
+        Required 'age' of post (in minutes) to be crossposted.
+    sleep_time : int
+        How long to wait between polls, in minutes.
+    coordinator : ShardCoordinator, optional
+        The coordinator that decides which of the feed's subreddits this client polls,
+        if sharding between clients.
+    claim_lease : float
+        How long posts stay claimed while being crossposted, in seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        cross_poster: CrossPoster,
+        subreddit_gatherer: SubredditPostGatherer,
+        wait_period: int,
+        sleep_time: int,
+        coordinator: ShardCoordinator = None,
+        claim_lease: float = 300,
+    ):
+        self.name = name
+        self.cross_poster = cross_poster
+        self.subreddit_gatherer = subreddit_gatherer
+        self.wait_period = wait_period
+        self.sleep_time = sleep_time
+        self.coordinator = coordinator
+        self.claim_lease = claim_lease
+        self.subreddit_names = subreddit_gatherer.subreddit_names
+        self.next_poll = 0
+
+    def next_wake(self) -> float:
+        """
+        Returns when the feed next has something to do: poll, or release posts that
+        came out of their wait period.
+        """
+        next_due = self.subreddit_gatherer.next_due()
+        if next_due is None:
+            return self.next_poll
+
+        return min(self.next_poll, next_due)
+
+    def run(self):
+        """
+        Polls the feed's subreddits if it's time to, otherwise releases its waiting
+        posts, and delivers what came out.
+        """
+        now = time.time()
+        if now >= self.next_poll:
+            self.next_poll = now + self.sleep_time * 60
+            self.shard()
+            posts = self.subreddit_gatherer.posts(self.wait_period)
+        else:
+            posts = self.subreddit_gatherer.release(self.wait_period)
+            if not posts:
+                return
+
+        if self.name:
+            print("Feed {}:".format(self.name))
+        self.deliver(posts)
+
+    def deliver(self, posts: list):
+        """
+        Delivers posts, putting them back in the delay queue if that raises.
+        """
+        try:
+            deliver(self.cross_poster, self.subreddit_gatherer, posts, self.claim_lease)
+        except Exception:
+            # they're past the high-water mark, so they'd be lost if not put back
+            self.subreddit_gatherer.requeue(posts)
+            raise
+
+    def renew_shard(self):
+        """
+        Updates which subreddits this client streams once every sleep_time, if
+        sharding. A streamed feed isn't polled, so this keeps its heartbeat going
+        instead.
+        """
+        now = time.time()
+        if self.coordinator is None or now < self.next_poll:
+            return
+
+        self.next_poll = now + self.sleep_time * 60
+        self.shard()
+
+    def shard(self):
+        """
+        Updates which of the feed's subreddits this client polls, if sharding.
+        """
+        if self.coordinator is None:
+            return
+
+        assigned = self.coordinator.assign(self.subreddit_names)
+        if assigned != self.subreddit_gatherer.subreddit_names:
+            print(
+                "Polling {} of {} subreddits.".format(
+                    len(assigned), len(self.subreddit_names)
+                )
+            )
+            self.subreddit_gatherer.set_subreddits(assigned)
+
+
+def build_feed(
+    config: configparser.ConfigParser,
+    section: str,
+    reddit: praw.Reddit,
+    caches: dict,
+    scheduler: DeliveryScheduler,
+    executor: ThreadPoolExecutor,
+) -> Feed:
+    """
+    Builds a feed from a section of the config. Options the section doesn't set are
+    taken from [xposter], except state_filename, and cache_<option> options override
+    the [cache] section for just this feed.
+
+    Parameters
+    ----------
+    config : configparser.ConfigParser
+        The parsed config.
+    section : str
+        The feed's section, like 'feed:news', or 'xposter' for a single feed config.
+    reddit : praw.Reddit
+        The Reddit client shared by every feed.
+    caches : dict
+        Caches already made for other feeds, by their options, so feeds with the same
+        cache settings share one. Feeds with the same local cache user and db file
+        always share one.
+    scheduler : DeliveryScheduler
+        The delivery scheduler shared by every feed.
+    executor : ThreadPoolExecutor
+        The webhook worker pool shared by every feed.
+
+    Returns
+    -------
+    Feed
+        The feed.
+    """
+    options = dict(config["xposter"])
+    options.pop("state_filename", None)
+    options.update(config[section])
+
+    cache_options = dict(config["cache"])
+    for option, value in config[section].items():
+        if option.startswith("cache_"):
+            cache_options[option[len("cache_") :]] = value
+    cache_key = tuple(sorted(cache_options.items()))
+    if cache_options.get("localcache_db_filename") and cache_options.get("username"):
+        # local caches for the same user and db file keep one set of known posts and
+        # claims, or each would let through posts only the other knows about
+        cache_key = (
+            cache_options["localcache_db_filename"],
+            cache_options["username"],
+        )
+    if cache_key not in caches:
+        caches[cache_key] = Cache(**cache_options)
 
     cross_poster = CrossPoster(
-        cache=cache,
-        webhook_urls=webhook_urls,
-        username=config["xposter"].get("username", None),
-        avatar_url=config["xposter"].get("avatar", None),
+        cache=caches[cache_key],
+        webhook_urls=[
+            webhook_url.strip() for webhook_url in options["webhook_urls"].split(",")
+        ],
+        username=options.get("username", None),
+        avatar_url=options.get("avatar", None),
         reddit_config_url=reddit.config.reddit_url,
+        scheduler=scheduler,
+        executor=executor,
     )
+    state_path = None
+    if "state_filename" in options:
+        state_path = DATABASE_FOLDER + options["state_filename"]
     subreddit_gatherer = SubredditPostGatherer(
         reddit,
-        config["xposter"]["subreddit"],
-        int(config["xposter"]["post_limit"]),
+        [subreddit_name.strip() for subreddit_name in options["subreddit"].split(",")],
+        int(options["post_limit"]),
+        post_limits=subreddit_overrides(config, "post_limit"),
+        wait_periods=subreddit_overrides(config, "wait_period"),
+        state_path=state_path,
+    )
+
+    coordinator = None
+    if options.get("sharded", "false").lower() in ("true", "yes", "on", "1"):
+        if not isinstance(caches[cache_key], RESTCache):
+            print("Sharding between clients needs a REST cache.")
+            exit()
+        # a client that misses a few heartbeats in a row is taken out of the ring
+        coordinator = ShardCoordinator(
+            caches[cache_key],
+            ttl=3 * int(options["sleep_time"]) * 60,
+        )
+
+    name = section[len("feed:") :] if section.startswith("feed:") else ""
+    return Feed(
+        name,
+        cross_poster,
+        subreddit_gatherer,
+        int(options["wait_period"]),
+        int(options["sleep_time"]),
+        coordinator,
+        int(options.get("claim_lease", 300)),
     )
+
+
+def run_feeds(feeds: list, jobs: list = ()):
+    """
+    Runs feeds forever, each whenever it next has something to do. An error in one feed
+    is printed and that feed is left alone for a while, backing off further each time
+    it fails in a row, while the others keep running.
+
+    Parameters
+    ----------
+    feeds : list[Feed]
+        The feeds to run.
+    jobs : list, optional
+        Maintenance jobs to run in between, like a RetentionJob. Anything with
+        next_wake() and run() methods, like a feed.
+    """
+    tasks = list(feeds) + list(jobs)
+    # task -> (failures in a row, when it may run again)
+    backoff = {}
+
+    def wake(task) -> float:
+        return max(task.next_wake(), backoff.get(task, (0, 0))[1])
+
     while True:
-        posts = subreddit_gatherer.posts(int(config["xposter"]["wait_period"]))
-        good_posts = cross_poster.cache.check_posts(posts)
-        print(
-            "Checked posts at: {} and found {} good posts.".format(
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"), len(good_posts)
+        task = min(tasks, key=wake)
+        time.sleep(max(wake(task) - time.time(), 0))
+        try:
+            task.run()
+        except Exception as e:
+            failures = backoff.get(task, (0, 0))[0] + 1
+            delay = min(FAILURE_BACKOFF * 2 ** (failures - 1), MAX_FAILURE_BACKOFF)
+            print(
+                "Error running {}, trying it again in {:.0f}s: {!r}".format(
+                    getattr(task, "name", "") or type(task).__name__, delay, e
+                )
+            )
+            traceback.print_exc()
+            backoff[task] = (failures, time.time() + delay)
+        else:
+            backoff.pop(task, None)
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    reddit = praw.Reddit("xpost_bot", user_agent="xpost_bot v0.1")
+    scheduler = DeliveryScheduler()
+    executor = ThreadPoolExecutor(
+        max_workers=max(int(config["xposter"].get("max_concurrent_webhooks", 4)), 1)
+    )
+
+    sections = ["xposter"]
+    if "feeds" in config["xposter"]:
+        sections = [
+            "feed:" + feed_name.strip()
+            for feed_name in config["xposter"]["feeds"].split(",")
+        ]
+    caches = {}
+    feeds = [
+        build_feed(config, section, reddit, caches, scheduler, executor)
+        for section in sections
+    ]
+    for cache in caches.values():
+        if not isinstance(cache, RESTCache):
+            continue
+        # turned down logins won't work later either, so give up on them now, but a
+        # server that's down can come back
+        try:
+            cache.login()
+        except RuntimeError as e:
+            print(e)
+            exit()
+        except requests.RequestException as e:
+            print("Error reaching the cache server, logging in later: {}".format(e))
+
+    jobs = []
+    local_caches = [cache for cache in caches.values() if isinstance(cache, LocalCache)]
+    retention_keep_last = int(config["xposter"].get("retention_keep_last", 0))
+    retention_max_age_days = float(config["xposter"].get("retention_max_age_days", 0))
+    if local_caches and (retention_keep_last > 0 or retention_max_age_days > 0):
+        jobs.append(
+            RetentionJob(
+                local_caches,
+                retention_keep_last,
+                retention_max_age_days,
+                float(config["xposter"].get("retention_interval", 3600)),
             )
         )
 
-        for submission in good_posts:
-            cross_poster.post_submission(submission)
-        time.sleep(int(config["xposter"]["sleep_time"]) * 60)
+    if len(feeds) == 1 and config["xposter"].get("mode", "poll") == "stream":
+        feed = feeds[0]
+        feed.renew_shard()
+        interval = float(config["xposter"].get("stream_interval", 30))
+        for posts in feed.subreddit_gatherer.stream(feed.wait_period, interval):
+            try:
+                feed.renew_shard()
+                if posts:
+                    feed.deliver(posts)
+            except Exception:
+                print("Error streaming, trying again in a bit:")
+                traceback.print_exc()
+            for job in jobs:
+                if time.time() >= job.next_wake():
+                    job.run()
+        return
+
+    try:
+        run_feeds(feeds, jobs)
+    finally:
+        for feed in feeds:
+            if feed.coordinator is not None:
+                feed.coordinator.leave()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""
+In-place upgrades for LocalCache databases created by older versions of the client.
+
+metadata.create_all() only creates tables that are missing, so anything added to an
+existing table (like an index) has to be applied here. The client and server are built
+into separate images, so the upgrades to the posts table that both need are repeated
+here rather than shared, and only the ones the LocalCache's schema needs are kept.
+"""
+
+import datetime
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+
+
+def has_index(connection, table: str, name: str) -> bool:
+    """
+    Checks whether a table has an index.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to inspect the database with.
+    table : str
+        The table the index is on.
+    name : str
+        The index's name.
+
+    Returns
+    -------
+    bool
+        True if the index exists.
+    """
+    return name in [index["name"] for index in inspect(connection).get_indexes(table)]
+
+
+def create_post_index(connection) -> int:
+    """
+    Creates the unique (username, subreddit, post_id) index on the posts table, if it
+    does not already exist. Duplicate posts left behind by past races would stop the
+    index from being made, so they're removed first, keeping the oldest row of each.
+    The duplicates are looked for with a scan of the whole table, which is skipped once
+    the index exists.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to create the index with.
+
+    Returns
+    -------
+    int
+        The number of duplicate rows removed.
+    """
+    if has_index(connection, "posts", "ix_posts_username_subreddit_post_id"):
+        return 0
+
+    removed = connection.execute(
+        text(
+            "DELETE FROM posts WHERE id NOT IN "
+            "(SELECT MIN(id) FROM posts GROUP BY username, subreddit, post_id)"
+        )
+    ).rowcount
+    connection.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_posts_username_subreddit_post_id "
+            "ON posts (username, subreddit, post_id)"
+        )
+    )
+    return removed
+
+
+def add_column(connection, table: str, column: str, definition: str) -> bool:
+    """
+    Adds a column to an existing table, if it doesn't have it yet.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to alter the table with.
+    table : str
+        The table to add the column to.
+    column : str
+        The column's name.
+    definition : str
+        The column's type and constraints, as SQL.
+
+    Returns
+    -------
+    bool
+        True if the column was added.
+    """
+    columns = [existing["name"] for existing in inspect(connection).get_columns(table)]
+    if column in columns:
+        return False
+
+    connection.execute(
+        text("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+    )
+    return True
+
+
+def add_post_timestamps(connection):
+    """
+    Adds the created_utc and posted_at columns to the posts table and their indexes.
+    Posts from before have no creation time, so their posted_at is set to now, which
+    lets age based retention remove them once they're old enough.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to alter the table with.
+    """
+    add_column(connection, "posts", "created_utc", "DATETIME")
+    if add_column(connection, "posts", "posted_at", "DATETIME"):
+        connection.execute(
+            text(
+                "UPDATE posts SET posted_at = :now WHERE posted_at IS NULL"
+            ).bindparams(bindparam("now", type_=DateTime)),
+            {"now": datetime.datetime.utcnow()},
+        )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_posts_username_subreddit_created_utc "
+            "ON posts (username, subreddit, created_utc)"
+        )
+    )
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_posts_posted_at ON posts (posted_at)")
+    )
+
+
+def upgrade(engine):
+    """
+    Brings an existing LocalCache database up to date with the current models.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to upgrade.
+    """
+    with engine.begin() as connection:
+        removed = create_post_index(connection)
+        if removed:
+            print("Removed {} duplicate posts.".format(removed))
+        add_post_timestamps(connection)
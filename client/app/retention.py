@@ -0,0 +1,219 @@
+"""
+Keeps the LocalCache database from growing forever. Only the newest few posts of each
+subreddit are ever gathered, so older posts can never be checked again and only slow
+down the indexes and take up memory. They are deleted by count or by age, a chunk at a
+time, and the freed space handed back.
+"""
+
+import datetime
+import time
+
+from sqlalchemy import DateTime, bindparam, text
+
+# posts deleted per transaction
+CHUNK_SIZE = 1000
+
+
+def delete_in_chunks(engine, where: str, params: dict, chunk_size: int) -> int:
+    """
+    Deletes the posts matching a condition, each chunk in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    where : str
+        The SQL condition posts are deleted by.
+    params : dict
+        The condition's parameters. A 'cutoff' datetime is bound as a DateTime.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    statement = text(
+        "DELETE FROM posts WHERE id IN "
+        "(SELECT id FROM posts WHERE {} LIMIT :chunk_size)".format(where)
+    )
+    if isinstance(params.get("cutoff"), datetime.datetime):
+        statement = statement.bindparams(bindparam("cutoff", type_=DateTime))
+
+    removed = 0
+    while True:
+        with engine.begin() as connection:
+            deleted = connection.execute(
+                statement, dict(params, chunk_size=chunk_size)
+            ).rowcount
+        removed += deleted
+        if deleted < chunk_size:
+            return removed
+
+
+def prune_posts(engine, keep_last: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Deletes all but the newest keep_last posts of each user's subreddits. Each chunk is
+    deleted in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    keep_last : int
+        How many posts to keep for each user and subreddit.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    with engine.connect() as connection:
+        groups = connection.execute(
+            text(
+                "SELECT username, subreddit FROM posts GROUP BY username, subreddit "
+                "HAVING COUNT(*) > :keep_last"
+            ),
+            {"keep_last": keep_last},
+        ).all()
+
+    removed = 0
+    for username, subreddit in groups:
+        group = {"username": username, "subreddit": subreddit}
+        with engine.connect() as connection:
+            # the oldest post that is kept
+            cutoff = connection.execute(
+                text(
+                    "SELECT id FROM posts "
+                    "WHERE username = :username AND subreddit = :subreddit "
+                    "ORDER BY id DESC LIMIT 1 OFFSET :offset"
+                ),
+                dict(group, offset=keep_last - 1),
+            ).scalar()
+
+        removed += delete_in_chunks(
+            engine,
+            "username = :username AND subreddit = :subreddit AND id < :cutoff",
+            dict(group, cutoff=cutoff),
+            chunk_size,
+        )
+
+    return removed
+
+
+def prune_old_posts(engine, max_age_days: float, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Deletes posts made on Reddit more than max_age_days ago. Posts whose creation time
+    isn't known go by when they were crossposted instead. Each chunk is deleted in its
+    own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    max_age_days : float
+        How old a post can get before it's deleted, in days.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+    with engine.connect() as connection:
+        groups = connection.execute(
+            text("SELECT DISTINCT username, subreddit FROM posts")
+        ).all()
+
+    removed = 0
+    # one group at a time, so the (username, subreddit, created_utc) index is used
+    for username, subreddit in groups:
+        removed += delete_in_chunks(
+            engine,
+            "username = :username AND subreddit = :subreddit AND (created_utc < :cutoff "
+            "OR (created_utc IS NULL AND posted_at < :cutoff))",
+            dict(username=username, subreddit=subreddit, cutoff=cutoff),
+            chunk_size,
+        )
+
+    return removed
+
+
+def compact(engine):
+    """
+    Hands the space freed by deleted rows back. The database is switched to
+    incremental auto vacuum with one full VACUUM the first time, after which only the
+    free pages have to be released.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to compact.
+    """
+    with engine.connect() as connection:
+        # VACUUM can't run inside a transaction
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            print("Switching the database to incremental vacuum, this runs once.")
+            connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+        else:
+            connection.exec_driver_sql("PRAGMA incremental_vacuum")
+
+
+class RetentionJob:
+    """
+    Prunes and compacts the LocalCache databases every interval seconds. Runs between
+    feeds, like a feed, so it never touches a database while it's being used.
+
+    Parameters
+    ----------
+    caches : list[LocalCache]
+        The local caches to prune. Caches sharing a database file are pruned once.
+    keep_last : int
+        How many posts to keep for each user and subreddit, or 0 to keep them all.
+    max_age_days : float
+        How old posts can get before they're deleted, in days, or 0 to keep them all.
+    interval : float
+        How long to wait between runs, in seconds.
+    """
+
+    def __init__(
+        self, caches: list, keep_last: int, max_age_days: float, interval: float
+    ):
+        self.caches = caches
+        self.keep_last = keep_last
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.next_run = time.time() + interval
+
+    def next_wake(self) -> float:
+        return self.next_run
+
+    def run(self):
+        """
+        Prunes and compacts the databases, then reloads the caches' known posts.
+        """
+        self.next_run = time.time() + self.interval
+        engines = {}
+        for cache in self.caches:
+            engines.setdefault(cache.engine, []).append(cache)
+
+        for engine, caches in engines.items():
+            removed = 0
+            if self.max_age_days > 0:
+                removed += prune_old_posts(engine, self.max_age_days)
+            if self.keep_last > 0:
+                removed += prune_posts(engine, self.keep_last)
+            if not removed:
+                continue
+
+            print("Pruned {} old posts.".format(removed))
+            compact(engine)
+            for cache in caches:
+                cache.reload()
@@ -0,0 +1,69 @@
+import requests
+from caches.rest_cache import RESTCache
+from hash_ring import HashRing
+
+
+class ShardCoordinator:
+    """
+    Divides subreddits between several clients that share a user on the REST server.
+    Every client sends heartbeats to the server, and places the live clients on a
+    consistent hash ring to decide which subreddits it polls, so each subreddit is
+    polled by one client and only a few move when a client joins or leaves. Posts are
+    also claimed on the server before being crossposted, so that a post picked up by
+    two clients while the subreddits are being handed over is still only posted once.
+
+    Parameters
+    ----------
+    cache : RESTCache
+        The cache shared with the other clients.
+    ttl : float
+        How long this client counts as live after each heartbeat, in seconds. Should be
+        a few times longer than the time between heartbeats.
+    """
+
+    def __init__(self, cache: RESTCache, ttl: float):
+        self.cache = cache
+        self.ttl = ttl
+        self.workers = [cache.worker_id]
+
+    def assign(self, subreddit_names: list) -> list:
+        """
+        Sends a heartbeat and works out which of the subreddits belong to this client.
+        If the server can't be reached, the last known workers are used.
+
+        Parameters
+        ----------
+        subreddit_names : list[str]
+            All of the subreddits shared between the clients.
+
+        Returns
+        -------
+        list[str]
+            The subreddits this client should poll.
+        """
+        try:
+            workers = self.cache.heartbeat(self.ttl)
+        except requests.RequestException as e:
+            print("Error sending heartbeat, keeping the current shard: {}".format(e))
+            workers = self.workers
+
+        if workers != self.workers:
+            print("Sharding subreddits between workers: {}".format(", ".join(workers)))
+        self.workers = workers
+
+        ring = HashRing(workers)
+        return [
+            name
+            for name in subreddit_names
+            if ring.node_for(name.lower()) == self.cache.worker_id
+        ]
+
+    def leave(self):
+        """
+        Takes this client out of the ring when it shuts down, so its subreddits are
+        handed to the other clients straight away.
+        """
+        try:
+            self.cache.leave()
+        except (requests.RequestException, RuntimeError) as e:
+            print("Error leaving the workers: {}".format(e))
@@ -0,0 +1,181 @@
+import time
+import praw
+
+
+class SubmissionValidator:
+    """
+    Re-checks submissions right before they're posted, so ones that were removed or
+    deleted after they were fetched aren't crossposted. Submissions are looked up again
+    with reddit.info, which takes up to 100 at a time, rather than one request each.
+    """
+
+    # reddit.info accepts at most this many fullnames per call
+    INFO_BATCH_SIZE = 100
+
+    def __init__(self, reddit: praw.Reddit, fresh_for: float = 30):
+        """
+        Initializer for SubmissionValidator.
+
+        Parameters
+        ----------
+        reddit : praw.Reddit
+            The reddit object to look submissions up with.
+        fresh_for : float
+            How long, in seconds, a submission returned by lookup() counts as up to
+            date, so it isn't looked up again.
+        """
+        self.reddit = reddit
+        self.fresh_for = fresh_for
+
+    @staticmethod
+    def is_removed(submission) -> bool:
+        """
+        Whether a submission was removed by a mod, an admin or the spam filter, or
+        deleted by its author.
+
+        Parameters
+        ----------
+        submission : Any
+            The submission to check.
+
+        Returns
+        -------
+        bool
+            True if the submission shouldn't be posted.
+        """
+        # read from vars so that a missing field doesn't make PRAW fetch the post
+        data = vars(submission)
+        return bool(
+            data.get("removal_reason")
+            or data.get("removed_by_category")
+            or ("author" in data and data["author"] is None)
+        )
+
+    @classmethod
+    def batches(cls, fullnames: list) -> list:
+        """
+        Splits fullnames into batches small enough for one reddit.info call each.
+        """
+        return [
+            fullnames[start : start + cls.INFO_BATCH_SIZE]
+            for start in range(0, len(fullnames), cls.INFO_BATCH_SIZE)
+        ]
+
+    @staticmethod
+    def mark_looked_up(submissions: list):
+        now = time.time()
+        for submission in submissions:
+            submission._looked_up_at = now
+
+    def lookup(self, fullnames: list) -> list:
+        """
+        Looks submissions up again, in batches.
+
+        Parameters
+        ----------
+        fullnames : list[str]
+            The fullnames of the submissions.
+
+        Returns
+        -------
+        list
+            The submissions reddit still has. Ones that are gone entirely are left out.
+        """
+        submissions = []
+        for batch in self.batches(fullnames):
+            submissions.extend(self.reddit.info(fullnames=batch))
+        self.mark_looked_up(submissions)
+
+        return submissions
+
+    def stale(self, submissions: list) -> list:
+        """
+        Returns the fullnames of the submissions that weren't just looked up.
+        """
+        now = time.time()
+        return [
+            submission.fullname
+            for submission in submissions
+            if now - vars(submission).get("_looked_up_at", 0) > self.fresh_for
+        ]
+
+    def keep(self, submissions: list, stale: list, refreshed: list) -> list:
+        """
+        Swaps in the up to date versions of looked up submissions, and drops the ones
+        that were removed or deleted.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions being validated.
+        stale : list[str]
+            The fullnames that were looked up.
+        refreshed : list
+            What the lookup returned.
+
+        Returns
+        -------
+        list
+            The submissions that can still be posted, in the same order.
+        """
+        refreshed = {submission.fullname: submission for submission in refreshed}
+        stale = set(stale)
+
+        result = []
+        for submission in submissions:
+            if submission.fullname in refreshed:
+                submission = refreshed[submission.fullname]
+            elif submission.fullname in stale:
+                # reddit doesn't have it any more
+                continue
+
+            if not self.is_removed(submission):
+                result.append(submission)
+
+        return result
+
+    def validate(self, submissions: list) -> list:
+        """
+        Looks up the given submissions again, unless they were just looked up, and
+        drops the ones that were removed or deleted.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to check.
+
+        Returns
+        -------
+        list
+            The up to date versions of the submissions that can still be posted, in the
+            same order.
+        """
+        stale = self.stale(submissions)
+        return self.keep(submissions, stale, self.lookup(stale))
+
+
+class AsyncSubmissionValidator(SubmissionValidator):
+    """
+    The SubmissionValidator for asyncpraw, whose lookups have to be awaited. Takes an
+    asyncpraw.Reddit instead of a praw.Reddit.
+    """
+
+    async def lookup(self, fullnames: list) -> list:
+        """
+        Looks submissions up again, in batches, like SubmissionValidator.lookup.
+        """
+        submissions = []
+        for batch in self.batches(fullnames):
+            async for submission in self.reddit.info(fullnames=batch):
+                submissions.append(submission)
+        self.mark_looked_up(submissions)
+
+        return submissions
+
+    async def validate(self, submissions: list) -> list:
+        """
+        Looks submissions up again and drops removed ones, like
+        SubmissionValidator.validate.
+        """
+        stale = self.stale(submissions)
+        return self.keep(submissions, stale, await self.lookup(stale))
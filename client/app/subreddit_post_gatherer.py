@@ -1,18 +1,47 @@
+import json
+import os
+import time
 import praw
 import prawcore
-from datetime import datetime
+from delay_queue import DelayQueue
+from submission_validator import SubmissionValidator
 
 
 class SubredditPostGatherer:
     """
-    Gathers posts from a given subreddit.
+    Gathers posts from one or more subreddits. Subreddits are fetched together through
+    combined 'a+b+c' listings, so polling N subreddits takes far fewer than N requests.
+
+    Only posts newer than the newest one already seen (the high-water mark) are fetched
+    on each poll. Posts still inside their wait period wait in a delay queue, ordered by
+    when they become old enough, and are looked up again through a SubmissionValidator
+    once they are, instead of being re-fetched every poll. Both can be saved to a
+    state file so a restart picks up where it left off.
+
+    Posts can also be streamed, in which case new posts are picked up as they're made and
+    released once they're past their wait period.
     """
 
+    # combined listings are split up so their urls stay short
+    MAX_SUBREDDITS_PER_LISTING = 50
+    MAX_LISTING_NAME_LENGTH = 1000
+    # how often a listing is fetched in full, in case the post used as the
+    # high-water mark was deleted (reddit then returns nothing newer than it)
+    FULL_REFRESH_INTERVAL = 10
+    # how long to wait before trying again with posts that couldn't be looked up or
+    # delivered, in seconds
+    RETRY_DELAY = 60
+
     def __init__(
         self,
         reddit: praw.Reddit,
-        subreddit_name: str,
+        subreddit_names,
         post_limit: int,
+        *,
+        post_limits: dict = None,
+        wait_periods: dict = None,
+        state_path: str = None,
+        validator: SubmissionValidator = None,
     ):
         """
         Initializer for SubredditPostGatherer.
@@ -20,46 +49,297 @@ class SubredditPostGatherer:
         Parameters
         ----------
         reddit : praw.Reddit
-            The reddit object to use and retrieve a subreddit object from.
-        subreddit_name : str
-            The name of the subreddit to gather posts from.
+            The reddit object to use and retrieve subreddit objects from.
+        subreddit_names : str | list[str]
+            The name of the subreddit, or a list of the names of the subreddits, to
+            gather posts from.
         post_limit : int
-            The maximum number of posts to retrieve from the subreddit at a given time.
+            The maximum number of posts to retrieve from each subreddit at a given time.
+        post_limits : dict[str, int], optional
+            Per-subreddit overrides for post_limit.
+        wait_periods : dict[str, int], optional
+            Per-subreddit overrides for the wait period given to posts().
+        state_path : str, optional
+            Where to save the high-water marks and waiting posts between runs. If not
+            given, they are only kept in memory.
+        validator : SubmissionValidator, optional
+            What to look waiting posts up again with once they're old enough. One is
+            made if not given.
         """
-        self.subreddit = reddit.subreddit(subreddit_name)
+        if isinstance(subreddit_names, str):
+            subreddit_names = [subreddit_names]
+
+        self.reddit = reddit
+        self.subreddit_names = list(subreddit_names)
         self.post_limit = post_limit
+        # reddit's display names may differ in case from the configured ones
+        self.post_limits = {
+            name.lower(): limit for name, limit in (post_limits or {}).items()
+        }
+        self.wait_periods = {
+            name.lower(): period for name, period in (wait_periods or {}).items()
+        }
+        self.listings = self.combine(self.subreddit_names)
+        self.polls = 0
+        self.state_path = state_path
+        self.validator = validator or SubmissionValidator(reddit)
+        # subreddit name -> fullname of the newest post seen in it
+        self.newest = {}
+        # (due, fullname, [subreddit name, created_utc]) of posts waiting out their
+        # wait period
+        self.queue = DelayQueue()
+        self.load_state()
 
-    def posts(self, wait_period: int) -> list:
+    @classmethod
+    def combine(cls, subreddit_names: list) -> list:
         """
-        Retrieves posts from this subreddit, with a given wait period.
+        Splits subreddits into groups that can each be fetched as one combined listing.
 
         Parameters
         ----------
-        list
-            Returns a list of submissions that were both not removed by a mod, and also
-            past the set wait period
+        subreddit_names : list[str]
+            The subreddits to group.
 
-        wait_period : int
-            Required 'age' of post (in minutes) to be considered valid. Intended so that
-            spam bots which are removed after a few minutes are effectively 'ignored'.
+        Returns
+        -------
+        list[list[str]]
+            The groups of subreddit names.
+        """
+        listings = []
+        current = []
+        for name in subreddit_names:
+            if current and (
+                len(current) >= cls.MAX_SUBREDDITS_PER_LISTING
+                or len("+".join(current + [name])) > cls.MAX_LISTING_NAME_LENGTH
+            ):
+                listings.append(current)
+                current = []
+            current.append(name)
+
+        if current:
+            listings.append(current)
+
+        return listings
+
+    def set_subreddits(self, subreddit_names: list):
+        """
+        Changes which subreddits are gathered from, like when they are re-divided
+        between several clients. High-water marks are kept for subreddits that are
+        dropped, in case they come back.
+
+        Parameters
+        ----------
+        subreddit_names : list[str]
+            The subreddits to gather posts from.
+        """
+        self.subreddit_names = list(subreddit_names)
+        self.listings = self.combine(self.subreddit_names)
+
+    @staticmethod
+    def position(fullname: str) -> int:
+        """
+        Returns where a post falls in reddit's ordering. Ids are base 36 and handed out
+        in increasing order, so a larger number is a newer post.
+        """
+        return int(fullname.split("_")[-1], 36)
+
+    @classmethod
+    def oldest_first(cls, submission) -> tuple:
+        """
+        Sort key that puts submissions oldest to newest, using their ids to order ones
+        made in the same second.
+        """
+        return (submission.created_utc, cls.position(submission.fullname))
+
+    def load_state(self):
+        """
+        Loads the high-water marks and waiting posts from the state file, if there is
+        one.
+        """
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+
+        with open(self.state_path) as state_file:
+            state = json.load(state_file)
+        self.newest = state.get("newest", {})
+        self.queue = DelayQueue(state.get("queue", []))
+        # older state files kept a plain dict of pending posts, which are looked up
+        # straight away and held again if they're still too young
+        for fullname, item in state.get("pending", {}).items():
+            self.queue.push(item[1], fullname, item)
+
+    def save_state(self):
+        """
+        Saves the high-water marks and waiting posts to the state file, if there is one.
+        Should be called once a poll's posts have been dealt with, so that posts are
+        never marked as handled before they were delivered.
+        """
+        if not self.state_path:
+            return
+
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w") as state_file:
+            json.dump(
+                {"newest": self.newest, "queue": self.queue.entries()}, state_file
+            )
+        os.replace(temporary_path, self.state_path)
+
+    def limit_for(self, subreddit_name: str) -> int:
+        return self.post_limits.get(subreddit_name.lower(), self.post_limit)
+
+    def wait_period_for(self, subreddit_name: str, wait_period: int) -> int:
+        return self.wait_periods.get(subreddit_name.lower(), wait_period)
+
+    def fetch_listing(self, subreddit_names: list) -> tuple:
+        """
+        Fetches the posts of a group of subreddits that are newer than their high-water
+        marks with one combined listing, keeping at most each subreddit's post limit.
+
+        Parameters
+        ----------
+        subreddit_names : list[str]
+            The subreddits to fetch.
 
         Returns
         -------
+        tuple[list, list[str]]
+            The new submissions, newest first, and the subreddits that may have new
+            posts past the end of the listing because busier ones filled it up.
         """
-        # get in reverse order to post oldest to newest
+        names = [name.lower() for name in subreddit_names]
+        known = [self.newest[name] for name in names if name in self.newest]
+        params = {}
+        if known and self.polls % self.FULL_REFRESH_INTERVAL:
+            params["before"] = max(known, key=self.position)
+        # everything at or below the oldest mark has been seen in every subreddit
+        seen_by_all = 0
+        if len(known) == len(names):
+            seen_by_all = min(self.position(fullname) for fullname in known)
+
+        subreddit = self.reddit.subreddit("+".join(subreddit_names))
+        limit = sum(self.limit_for(name) for name in subreddit_names)
+        counts = {}
+        # subreddits whose high-water mark the listing got down to
+        reached = set()
+        fetched = 0
         result = []
+        for submission in subreddit.new(limit=limit, params=params):
+            fetched += 1
+            position = self.position(submission.fullname)
+            if position <= seen_by_all:
+                reached.update(names)
+                break
+
+            name = submission.subreddit.display_name.lower()
+            if name in self.newest and position <= self.position(self.newest[name]):
+                reached.add(name)
+                continue
+
+            counts[name] = counts.get(name, 0) + 1
+            if counts[name] <= self.limit_for(name):
+                result.append(submission)
+
+        if fetched < limit:
+            # the listing ran out, so there's nothing past its end
+            return result, []
+
+        starved = [
+            subreddit_name
+            for subreddit_name, name in zip(subreddit_names, names)
+            if name not in reached and counts.get(name, 0) < self.limit_for(name)
+        ]
+        return result, starved
+
+    def fetch(self, subreddit_names: list) -> list:
+        """
+        Fetches the posts of a group of subreddits that are newer than their high-water
+        marks, keeping at most each subreddit's post limit. The group is fetched as one
+        combined listing, and any subreddit that busier ones pushed out of it is fetched
+        again on its own.
+
+        Parameters
+        ----------
+        subreddit_names : list[str]
+            The subreddits to fetch.
+
+        Returns
+        -------
+        list
+            The new submissions.
+        """
+        result, starved = self.fetch_listing(subreddit_names)
+        if len(subreddit_names) > 1:
+            fullnames = {submission.fullname for submission in result}
+            for subreddit_name in starved:
+                result.extend(
+                    submission
+                    for submission in self.fetch_listing([subreddit_name])[0]
+                    if submission.fullname not in fullnames
+                )
+
+        for submission in result:
+            name = submission.subreddit.display_name.lower()
+            if name not in self.newest or self.position(
+                submission.fullname
+            ) > self.position(self.newest[name]):
+                self.newest[name] = submission.fullname
+
+        return result
+
+    def requeue(self, submissions: list):
+        """
+        Puts submissions back in the delay queue, so they are returned again after
+        RETRY_DELAY. For submissions that could not be delivered.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to requeue.
+        """
+        due = time.time() + self.RETRY_DELAY
+        for submission in submissions:
+            self.queue.push(
+                due,
+                submission.fullname,
+                [submission.subreddit.display_name, submission.created_utc],
+            )
+
+    def next_due(self):
+        """
+        Returns when the next waiting post is due to be released, or None if there
+        aren't any.
+        """
+        return self.queue.next_due()
+
+    def release_time(
+        self, subreddit_name: str, created_utc: float, wait_period: int
+    ) -> float:
+        # a post has to be more than wait_period whole minutes old
+        return created_utc + (self.wait_period_for(subreddit_name, wait_period) + 1) * 60
+
+    def is_old_enough(
+        self, subreddit_name: str, created_utc: float, wait_period: int, now: float
+    ) -> bool:
+        return now >= self.release_time(subreddit_name, created_utc, wait_period)
+
+    @staticmethod
+    def guarded(function, *args):
+        """
+        Calls something that talks to Reddit, printing instead of raising the errors
+        that usually fix themselves.
+
+        Parameters
+        ----------
+        function : Callable
+            The function to call.
+
+        Returns
+        -------
+        Any
+            What the function returned, or None if it failed.
+        """
         try:
-            submissions = [
-                submission for submission in self.subreddit.new(limit=self.post_limit)
-            ][::-1]
-            for submission in submissions:
-                if not submission.removal_reason:
-                    time_passed = int(
-                        (datetime.timestamp(datetime.now()) - submission.created_utc)
-                        / 60
-                    )
-                    if time_passed > wait_period:
-                        result.append(submission)
+            return function(*args)
         except RuntimeError:
             print("Error, trying again in a bit...")
         except prawcore.exceptions.RequestException:
@@ -70,4 +350,227 @@ class SubredditPostGatherer:
         except prawcore.exceptions.ResponseException:
             print("Reponse exception...")
 
+        return None
+
+    def sift(self, submissions: list, wait_period: int, now: float) -> list:
+        """
+        Drops removed submissions and puts ones that are still too young in the delay
+        queue.
+
+        Parameters
+        ----------
+        submissions : list
+            The submissions to sift through.
+        wait_period : int
+            Required 'age' of post (in minutes) to be considered valid.
+        now : float
+            The current Unix timestamp.
+
+        Returns
+        -------
+        list
+            The submissions that can be posted.
+        """
+        result = []
+        for submission in submissions:
+            if self.validator.is_removed(submission):
+                continue
+
+            name = submission.subreddit.display_name
+            if self.is_old_enough(name, submission.created_utc, wait_period, now):
+                result.append(submission)
+            else:
+                self.queue.push(
+                    self.release_time(name, submission.created_utc, wait_period),
+                    submission.fullname,
+                    [name, submission.created_utc],
+                )
+
+        return result
+
+    def release(self, wait_period: int) -> list:
+        """
+        Releases the waiting posts that are now old enough, after looking them up again
+        to check they weren't removed in the meantime.
+
+        Parameters
+        ----------
+        wait_period : int
+            Required 'age' of post (in minutes) to be considered valid.
+
+        Returns
+        -------
+        list
+            The released submissions that weren't removed, oldest first.
+        """
+        now = time.time()
+        matured = self.queue.pop_due(now)
+        if not matured:
+            return []
+
+        refreshed = self.guarded(
+            self.validator.lookup, [fullname for _, fullname, _ in matured]
+        )
+        return self.settle(matured, refreshed, wait_period, now)
+
+    def settle(self, matured: list, refreshed, wait_period: int, now: float) -> list:
+        """
+        Deals with waiting posts that came due once they've been looked up again. Split
+        out of release() so that the lookup can also be done asynchronously.
+
+        Parameters
+        ----------
+        matured : list[tuple]
+            The (due, fullname, item) entries that were taken out of the delay queue.
+        refreshed : list, optional
+            The looked up submissions, or None if they couldn't be looked up, in which
+            case the entries are put back to be tried again after RETRY_DELAY.
+        wait_period : int
+            Required 'age' of post (in minutes) to be considered valid.
+        now : float
+            The current Unix timestamp.
+
+        Returns
+        -------
+        list
+            The submissions that weren't removed and can be posted, oldest first.
+        """
+        if refreshed is None:
+            for _, fullname, item in matured:
+                self.queue.push(now + self.RETRY_DELAY, fullname, item)
+            return []
+
+        result = self.sift(refreshed, wait_period, now)
+        result.sort(key=self.oldest_first)
+        return result
+
+    def posts(self, wait_period: int) -> list:
+        """
+        Retrieves posts from these subreddits, with a given wait period.
+
+        Parameters
+        ----------
+        wait_period : int
+            Required 'age' of post (in minutes) to be considered valid. Intended so that
+            spam bots which are removed after a few minutes are effectively 'ignored'.
+            Subreddits with their own wait period use that instead.
+
+        Returns
+        -------
+        list
+            Returns a list of submissions that were both not removed by a mod, and also
+            past the set wait period, oldest first. Each is only returned once, unless
+            it is requeued.
+        """
+        submissions = []
+        for subreddit_names in self.listings:
+            submissions.extend(self.guarded(self.fetch, subreddit_names) or [])
+        self.polls += 1
+
+        result = self.sift(submissions, wait_period, time.time())
+        result.extend(self.release(wait_period))
+        # sort to post oldest to newest
+        result.sort(key=self.oldest_first)
+        return result
+
+    def read_stream(self, stream) -> list:
+        """
+        Reads everything a submission stream has available right now, skipping posts
+        that were already seen.
+
+        Parameters
+        ----------
+        stream : Generator
+            A submission stream made with pause_after set, so it yields None when
+            there's nothing new.
+
+        Returns
+        -------
+        list
+            The new submissions.
+        """
+        result = []
+        for submission in stream:
+            if submission is None:
+                break
+
+            if self.mark_seen(submission):
+                result.append(submission)
+
         return result
+
+    def mark_seen(self, submission) -> bool:
+        """
+        Moves the high-water mark of a streamed submission's subreddit up to it, unless
+        it was already seen.
+
+        Parameters
+        ----------
+        submission : Any
+            The streamed submission.
+
+        Returns
+        -------
+        bool
+            True if the submission is newer than anything seen in its subreddit before.
+        """
+        name = submission.subreddit.display_name.lower()
+        position = self.position(submission.fullname)
+        if name in self.newest and position <= self.position(self.newest[name]):
+            return False
+
+        self.newest[name] = submission.fullname
+        return True
+
+    def stream(self, wait_period: int, interval: float = 30):
+        """
+        Streams posts from these subreddits instead of polling their listings. New posts
+        wait in the delay queue until they're past their wait period, and are then
+        looked up again to check they weren't removed in the meantime. If the
+        subreddits are changed with set_subreddits() in between, the streams are
+        started again for the new ones.
+
+        Parameters
+        ----------
+        wait_period : int
+            Required 'age' of post (in minutes) to be considered valid. Subreddits with
+            their own wait period use that instead.
+        interval : float
+            The longest time to wait between checking the streams, in seconds.
+
+        Yields
+        ------
+        list
+            Submissions that are past their wait period and weren't removed, oldest
+            first. May be empty.
+        """
+        listings = None
+        while True:
+            if listings is not self.listings:
+                # the subreddits were changed since the last check, so start over
+                listings = self.listings
+                streams = [None] * len(listings)
+
+            submissions = []
+            for index, subreddit_names in enumerate(listings):
+                if streams[index] is None:
+                    subreddit = self.reddit.subreddit("+".join(subreddit_names))
+                    streams[index] = subreddit.stream.submissions(pause_after=0)
+
+                fresh = self.guarded(self.read_stream, streams[index])
+                if fresh is None:
+                    # a stream that raised is finished, so start a new one
+                    streams[index] = None
+                    continue
+                submissions.extend(fresh)
+
+            result = self.sift(submissions, wait_period, time.time())
+            result.extend(self.release(wait_period))
+            result.sort(key=self.oldest_first)
+            yield result
+
+            next_due = self.next_due()
+            pause = interval
+            if next_due is not None:
+                pause = min(pause, max(next_due - time.time(), 1))
+            time.sleep(pause)
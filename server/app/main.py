@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 import configparser
 import os
 
+from . import storage
+
 CONFIG_FILE = os.path.expanduser("~/.config/config.ini")
 DATABASE_FOLDER = "/database_folder/"
 
@@ -17,8 +20,11 @@ if "SQLALCHEMY_DATABASE_URI" not in config["database"]:
     )
     exit()
 
-app.config["SQLALCHEMY_DATABASE_URI"] = (
-    "sqlite:///" + DATABASE_FOLDER + config["database"]["SQLALCHEMY_DATABASE_URI"]
+app.config["SQLALCHEMY_DATABASE_URI"] = storage.database_uri(
+    config["database"]["SQLALCHEMY_DATABASE_URI"], DATABASE_FOLDER
+)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = storage.engine_options(
+    app.config["SQLALCHEMY_DATABASE_URI"], config["database"]
 )
 
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = config["database"].getboolean(
@@ -31,11 +37,38 @@ app.config["database"] = db
 app.config["allow_registration"] = config["xposter"].getboolean(
     "allow_registration", False
 )
+app.config["user_cache_size"] = config["xposter"].getint("user_cache_size", 1024)
+app.config["user_cache_ttl"] = config["xposter"].getfloat("user_cache_ttl", 60)
 
 with app.app_context():
+    if db.engine.dialect.name == "sqlite":
+        event.listen(
+            db.engine,
+            "connect",
+            storage.sqlite_pragmas(
+                config["database"].getint("sqlite_busy_timeout", 5000)
+            ),
+        )
+
     from .user import users_page, User
     from .post import posts_page, Post
+    from .worker import workers_page, Worker
+    from . import migrations, retention
 
     app.register_blueprint(users_page, url_prefix="/users")
     app.register_blueprint(posts_page, url_prefix="/posts")
-    db.create_all()
+    app.register_blueprint(workers_page, url_prefix="/workers")
+    with migrations.locked(DATABASE_FOLDER + "migrations.lock"):
+        db.create_all()
+        migrations.upgrade(db)
+
+    retention_keep_last = config["xposter"].getint("retention_keep_last", 0)
+    retention_max_age_days = config["xposter"].getfloat("retention_max_age_days", 0)
+    if retention_keep_last > 0 or retention_max_age_days > 0:
+        retention.RetentionJob(
+            db.engine,
+            retention_keep_last,
+            retention_max_age_days,
+            config["xposter"].getfloat("retention_interval", 3600),
+            DATABASE_FOLDER + "retention.lock",
+        ).start()
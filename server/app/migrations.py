@@ -0,0 +1,195 @@
+"""
+In-place upgrades for databases created by older versions of the server.
+
+db.create_all() only creates tables that are missing, so anything added to an existing
+table (like an index) has to be applied here.
+"""
+
+import contextlib
+import datetime
+import fcntl
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+
+
+@contextlib.contextmanager
+def locked(lock_path: str):
+    """
+    Holds a lock file for the duration of the block, so only one gunicorn worker at a
+    time creates and upgrades the tables. The others wait, then find nothing to do.
+
+    Parameters
+    ----------
+    lock_path : str
+        The lock file shared between the workers.
+    """
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def has_index(connection, table: str, name: str) -> bool:
+    """
+    Checks whether a table has an index.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to inspect the database with.
+    table : str
+        The table the index is on.
+    name : str
+        The index's name.
+
+    Returns
+    -------
+    bool
+        True if the index exists.
+    """
+    return name in [index["name"] for index in inspect(connection).get_indexes(table)]
+
+
+def create_post_index(connection) -> int:
+    """
+    Creates the unique (username, subreddit, post_id) index on the posts table, if it
+    does not already exist. Duplicate posts left behind by past races would stop the
+    index from being made, so they're removed first, keeping the oldest row of each.
+    The duplicates are looked for with a scan of the whole table, which is skipped once
+    the index exists.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to create the index with.
+
+    Returns
+    -------
+    int
+        The number of duplicate rows removed.
+    """
+    if has_index(connection, "posts", "ix_posts_username_subreddit_post_id"):
+        return 0
+
+    removed = connection.execute(
+        text(
+            "DELETE FROM posts WHERE id NOT IN "
+            "(SELECT MIN(id) FROM posts GROUP BY username, subreddit, post_id)"
+        )
+    ).rowcount
+    connection.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_posts_username_subreddit_post_id "
+            "ON posts (username, subreddit, post_id)"
+        )
+    )
+    return removed
+
+
+def add_column(connection, table: str, column: str, definition: str) -> bool:
+    """
+    Adds a column to an existing table, if the table exists and doesn't have it yet.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to alter the table with.
+    table : str
+        The table to add the column to.
+    column : str
+        The column's name.
+    definition : str
+        The column's type and constraints, as SQL.
+
+    Returns
+    -------
+    bool
+        True if the column was added.
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return False
+    if column in [existing["name"] for existing in inspector.get_columns(table)]:
+        return False
+
+    connection.execute(
+        text("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+    )
+    return True
+
+
+def add_post_timestamps(connection):
+    """
+    Adds the created_utc and posted_at columns to the posts table and their indexes.
+    Posts from before have no creation time, so their posted_at is set to now, which
+    lets age based retention remove them once they're old enough.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to alter the table with.
+    """
+    add_column(connection, "posts", "created_utc", "TIMESTAMP")
+    if add_column(connection, "posts", "posted_at", "TIMESTAMP"):
+        connection.execute(
+            text(
+                "UPDATE posts SET posted_at = :now WHERE posted_at IS NULL"
+            ).bindparams(bindparam("now", type_=DateTime)),
+            {"now": datetime.datetime.utcnow()},
+        )
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_posts_username_subreddit_created_utc "
+            "ON posts (username, subreddit, created_utc)"
+        )
+    )
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_posts_posted_at ON posts (posted_at)")
+    )
+
+
+def create_pagination_indexes(connection):
+    """
+    Creates the indexes that posts are keyset paginated with, if they don't already
+    exist.
+
+    Parameters
+    ----------
+    connection : Connection
+        The connection to create the indexes with.
+    """
+    connection.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_posts_username_subreddit_id "
+            "ON posts (username, subreddit, id)"
+        )
+    )
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_posts_username_id ON posts (username, id)")
+    )
+
+
+def upgrade(db):
+    """
+    Brings an existing database up to date with the current models.
+
+    Parameters
+    ----------
+    db : SQLAlchemy
+        The database to upgrade.
+    """
+    with db.engine.begin() as connection:
+        removed = create_post_index(connection)
+        if removed:
+            print("Removed {} duplicate posts.".format(removed))
+        add_column(connection, "post_claims", "token", "VARCHAR(36)")
+        connection.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_post_claims_token "
+                "ON post_claims (token)"
+            )
+        )
+        add_post_timestamps(connection)
+        create_pagination_indexes(connection)
@@ -1,13 +1,20 @@
 from typing import Union
+import datetime
+import json
+import uuid
+from sqlalchemy import exists, literal, or_, select, tuple_, update
 from flask import (
     request,
     jsonify,
     make_response,
+    stream_with_context,
     Blueprint,
+    Response,
     current_app,
 )
 
 from .user import token_required, User
+from . import storage
 
 posts_page = Blueprint("posts_page", __name__)
 
@@ -26,24 +33,109 @@ class Post(db.Model):
     """
 
     __tablename__ = "posts"
+    __table_args__ = (
+        db.Index(
+            "ix_posts_username_subreddit_post_id",
+            "username",
+            "subreddit",
+            "post_id",
+            unique=True,
+        ),
+        db.Index(
+            "ix_posts_username_subreddit_created_utc",
+            "username",
+            "subreddit",
+            "created_utc",
+        ),
+        db.Index("ix_posts_posted_at", "posted_at"),
+        # for keyset pagination on id
+        db.Index("ix_posts_username_subreddit_id", "username", "subreddit", "id"),
+        db.Index("ix_posts_username_id", "username", "id"),
+    )
+    # SQLite caps bound parameters per statement, and each key in a tuple IN takes two
+    QUERY_CHUNK_SIZE = 400
+    # posts per page when paginating, and per batch read from the database when
+    # streaming
+    PAGE_SIZE = 500
+    MAX_PAGE_SIZE = 1000
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username = db.Column(db.String(255), nullable=False)
     subreddit = db.Column(db.String(255), nullable=False)
     post_id = db.Column(db.String(255), nullable=False)
+    # when the post was made on Reddit, unknown for posts added by older clients
+    created_utc = db.Column(db.DateTime)
+    # when the post was added, set to the upgrade time for posts from before it
+    posted_at = db.Column(db.DateTime)
 
-    def __init__(self, username: str, subreddit: str, post_id: str):
+    def __init__(
+        self,
+        username: str,
+        subreddit: str,
+        post_id: str,
+        created_utc: datetime.datetime = None,
+        posted_at: datetime.datetime = None,
+    ):
         self.username = username
         self.subreddit = subreddit
         self.post_id = post_id
+        self.created_utc = created_utc
+        self.posted_at = posted_at
 
     def to_dict(self):
         json_dict = {}
+        json_dict["id"] = self.id
         json_dict["username"] = self.username
         json_dict["subreddit"] = self.subreddit
         json_dict["post_id"] = self.post_id
+        json_dict["created_utc"] = self.to_timestamp(self.created_utc)
+        json_dict["posted_at"] = self.to_timestamp(self.posted_at)
 
         return json_dict
 
+    @staticmethod
+    def to_timestamp(value: datetime.datetime) -> Union[float, None]:
+        """
+        Converts a stored UTC time to a Unix timestamp, like Reddit's created_utc.
+
+        Parameters
+        ----------
+        value : datetime.datetime
+            The naive UTC time, or None.
+
+        Returns
+        -------
+        float, optional
+            The Unix timestamp, or None if the time isn't known.
+        """
+        if value is None:
+            return None
+
+        return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    @staticmethod
+    def from_timestamp(value) -> Union[datetime.datetime, None]:
+        """
+        Converts a Unix timestamp sent by a client to a naive UTC time for storing.
+
+        Parameters
+        ----------
+        value : Any
+            The Unix timestamp.
+
+        Returns
+        -------
+        datetime.datetime, optional
+            The naive UTC time, or None if the value isn't a usable timestamp.
+        """
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+
+        try:
+            return datetime.datetime.utcfromtimestamp(value)
+        except (OverflowError, OSError, ValueError):
+            return None
+
     @classmethod
     def jsonify_query(cls, query: list):
         """
@@ -66,28 +158,81 @@ class Post(db.Model):
         return jsonify(result)
 
     @classmethod
-    def get_subreddit_posts(cls, username: str, subreddit: str):
+    def stream_query(cls, query) -> Response:
         """
-        Retrieves posts for a specific user for a specific subreddit.
+        Streams a query as NDJSON, one post per line. Posts are read from the database
+        in batches of PAGE_SIZE while the response is being sent, so memory use stays
+        the same however many posts there are.
 
         Parameters
         ----------
-        username : str
-            User's username.
-        subreddit : str
-            Subreddit to be checked.
+        query : Query
+            The query for the posts.
 
         Returns
         -------
         Response
-            Jsonified query response.
+            The streamed NDJSON response.
         """
-        return cls.jsonify_query(
-            cls.query.filter_by(username=username, subreddit=subreddit)
+
+        def generate():
+            # sent a batch at a time, as writing out every line separately is slow
+            lines = []
+            for post in query.yield_per(cls.PAGE_SIZE):
+                lines.append(json.dumps(post.to_dict()) + "\n")
+                if len(lines) == cls.PAGE_SIZE:
+                    yield "".join(lines)
+                    lines = []
+            if lines:
+                yield "".join(lines)
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
         )
 
     @classmethod
-    def add_post(cls, username: str, subreddit: str, post_id: str) -> dict:
+    def narrow_query(
+        cls, query, since: float = None, limit: int = None, after: int = None
+    ):
+        """
+        Narrows a query for posts down to a window of recent posts, or to one page of
+        posts. Pages are keyset paginated on id, so each is found with an index lookup
+        however deep into the history it is.
+
+        Parameters
+        ----------
+        query : Query
+            The query for the posts.
+        since : float, optional
+            Only posts made on Reddit at or after this Unix timestamp are returned.
+            Posts whose creation time isn't known are left out.
+        limit : int, optional
+            The most posts returned. Without after, these are the newest posts.
+        after : int, optional
+            The cursor for a page: only posts with a higher id are returned, oldest
+            first, and at most PAGE_SIZE of them if no limit is given.
+
+        Returns
+        -------
+        Query
+            The narrowed query.
+        """
+        if since is not None:
+            query = query.filter(cls.created_utc >= cls.from_timestamp(since))
+        if after is not None:
+            query = query.filter(cls.id > after).order_by(cls.id)
+            limit = min(limit or cls.PAGE_SIZE, cls.MAX_PAGE_SIZE)
+        elif since is not None or limit is not None:
+            query = query.order_by(cls.created_utc.desc().nulls_last(), cls.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+
+        return query
+
+    @classmethod
+    def add_post(
+        cls, username: str, subreddit: str, post_id: str, created_utc=None
+    ) -> dict:
         """
         Add a given post to the database.
 
@@ -99,6 +244,8 @@ class Post(db.Model):
             Subreddit for the post.
         post_id : str
             Post id for the post.
+        created_utc : float, optional
+            When the post was made on Reddit, as a Unix timestamp.
 
         Returns
         -------
@@ -106,21 +253,69 @@ class Post(db.Model):
             Returns a dict, which contains the original post information as well as the
             'exists' keyword for whether or not the post existed before being added.
         """
-        post = Post.query.filter_by(
-            username=username, subreddit=subreddit, post_id=post_id
-        ).first()
         post_dict = dict(username=username, subreddit=subreddit, post_id=post_id)
-        if post:
-            post_dict["exists"] = True
-            return post_dict
-
-        post: Post = db.session.add(
-            cls(username=username, subreddit=subreddit, post_id=post_id)
+        post_dict["exists"] = not cls.insert_if_absent(
+            username,
+            subreddit,
+            post_id,
+            cls.from_timestamp(created_utc),
+            datetime.datetime.utcnow(),
         )
         db.session.commit()
-        post_dict["exists"] = False
+
         return post_dict
 
+    @classmethod
+    def insert_if_absent(
+        cls,
+        username: str,
+        subreddit: str,
+        post_id: str,
+        created_utc: datetime.datetime,
+        posted_at: datetime.datetime,
+    ) -> bool:
+        """
+        Inserts a post unless it is already in the database, as a single statement so
+        that concurrent requests can't both insert the same post. On databases where
+        two such statements can still race, the unique index stops the second one.
+        Does not commit.
+
+        Parameters
+        ----------
+        username : str
+            Username for the post.
+        subreddit : str
+            Subreddit for the post.
+        post_id : str
+            Post id for the post.
+        created_utc : datetime.datetime
+            When the post was made on Reddit, or None if it isn't known.
+        posted_at : datetime.datetime
+            When the post was added.
+
+        Returns
+        -------
+        bool
+            True if the post was inserted, False if it was already there.
+        """
+        already_there = exists().where(
+            cls.username == username,
+            cls.subreddit == subreddit,
+            cls.post_id == post_id,
+        )
+        return storage.insert_if_absent(
+            db.session,
+            cls.__table__,
+            ["username", "subreddit", "post_id", "created_utc", "posted_at"],
+            select(
+                literal(username),
+                literal(subreddit),
+                literal(post_id),
+                literal(created_utc, db.DateTime),
+                literal(posted_at, db.DateTime),
+            ).where(~already_there),
+        )
+
     @classmethod
     def add_posts(
         cls,
@@ -128,23 +323,52 @@ class Post(db.Model):
         posts: list,
     ) -> list:
         """
-        Adds multiple posts to the database.
+        Adds multiple posts to the database in a single transaction.
+
+        Posts already in the database are found with one batched probe, and the rest
+        are inserted with insert_if_absent so that a post added by another request in
+        the meantime is reported as existing instead of duplicated.
 
         Parameters
         ----------
         username : str
             Username to use for the posts.
         posts : list[dict[str, str]]
-            A list of posts, which should contain the 'subreddit' and 'post_id' keyword.
+            A list of posts, which should contain the 'subreddit' and 'post_id' keyword,
+            and may contain 'created_utc' as a Unix timestamp.
 
         Returns
         -------
         list[dict]
-            A list of subreddit posts that were successfully added.
+            A list of the given posts, each with the 'exists' keyword for whether or not
+            the post existed before being added.
         """
+        keys = [(thing["subreddit"], thing["post_id"]) for thing in posts]
+        found = cls.existing_post_keys(username, keys)
+        posted_at = datetime.datetime.utcnow()
+
         result = []
-        for thing in posts:
-            result.append(cls.add_post(username, thing["subreddit"], thing["post_id"]))
+        for thing, (subreddit, post_id) in zip(posts, keys):
+            exists_flag = (subreddit, post_id) in found
+            if not exists_flag:
+                exists_flag = not cls.insert_if_absent(
+                    username,
+                    subreddit,
+                    post_id,
+                    cls.from_timestamp(thing.get("created_utc")),
+                    posted_at,
+                )
+                found.add((subreddit, post_id))
+
+            result.append(
+                dict(
+                    username=username,
+                    subreddit=subreddit,
+                    post_id=post_id,
+                    exists=exists_flag,
+                )
+            )
+        db.session.commit()
 
         return result
 
@@ -185,6 +409,38 @@ class Post(db.Model):
             "exists": exists_flag,
         }
 
+    @classmethod
+    def existing_post_keys(cls, username: str, keys: list) -> set:
+        """
+        Finds which (subreddit, post_id) pairs are already in the database for a user.
+
+        The lookup is done with one tuple IN query per chunk of keys, rather than one
+        query per post.
+
+        Parameters
+        ----------
+        username : str
+            The username to check for.
+        keys : list[tuple[str, str]]
+            The (subreddit, post_id) pairs to look for.
+
+        Returns
+        -------
+        set[tuple[str, str]]
+            The subset of the given pairs that are already in the database.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = set()
+        for start in range(0, len(keys), cls.QUERY_CHUNK_SIZE):
+            chunk = keys[start : start + cls.QUERY_CHUNK_SIZE]
+            rows = cls.query.with_entities(cls.subreddit, cls.post_id).filter(
+                cls.username == username,
+                tuple_(cls.subreddit, cls.post_id).in_(chunk),
+            )
+            found.update((subreddit, post_id) for subreddit, post_id in rows)
+
+        return found
+
     @classmethod
     def check_posts(cls, username: str, posts: list) -> list:
         """
@@ -205,13 +461,363 @@ class Post(db.Model):
             boolean that is true if the post was already in the database and false
             otherwise.
         """
+        keys = [(post["subreddit"], post["post_id"]) for post in posts]
+        found = cls.existing_post_keys(username, keys)
+
+        result = []
+        for subreddit, post_id in keys:
+            result.append(
+                {
+                    "username": username,
+                    "subreddit": subreddit,
+                    "post_id": post_id,
+                    "exists": (subreddit, post_id) in found,
+                }
+            )
+
+        return result
+
+
+class PostClaim(db.Model):
+    """
+    A lease on a post, taken by a client that is about to crosspost it, so that other
+    clients of the same user leave it alone until the lease runs out or the claim is
+    committed or released. Posts claimed together share a claim token, which is used
+    to commit or release them.
+
+    Parameters
+    ----------
+    db : Any
+        A database connection.
+    """
+
+    __tablename__ = "post_claims"
+    __table_args__ = (
+        db.Index(
+            "ix_post_claims_username_subreddit_post_id",
+            "username",
+            "subreddit",
+            "post_id",
+            unique=True,
+        ),
+        db.Index("ix_post_claims_token", "token"),
+    )
+    # the longest lease a client may ask for, in seconds
+    MAX_LEASE = 3600
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    username = db.Column(db.String(255), nullable=False)
+    subreddit = db.Column(db.String(255), nullable=False)
+    post_id = db.Column(db.String(255), nullable=False)
+    worker = db.Column(db.String(255), nullable=False)
+    token = db.Column(db.String(36))
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def claim(
+        cls,
+        username: str,
+        worker: str,
+        token: str,
+        subreddit: str,
+        post_id: str,
+        now: datetime.datetime,
+        expires_at: datetime.datetime,
+    ) -> bool:
+        """
+        Claims a post for a worker, unless it has already been posted or another worker
+        holds an unexpired claim on it. A worker claiming a post it already holds
+        renews its lease and moves it to the new token. Each step is a single
+        conditional statement, so two workers can't both end up with the claim. Does
+        not commit.
+
+        Parameters
+        ----------
+        username : str
+            Username for the post.
+        worker : str
+            The id of the worker claiming the post.
+        token : str
+            The claim token the post is claimed under.
+        subreddit : str
+            Subreddit for the post.
+        post_id : str
+            Post id for the post.
+        now : datetime.datetime
+            The current time, claims that expired before it can be taken over.
+        expires_at : datetime.datetime
+            When the new lease runs out.
+
+        Returns
+        -------
+        bool
+            True if the worker now holds the claim.
+        """
+        posted = exists().where(
+            Post.username == username,
+            Post.subreddit == subreddit,
+            Post.post_id == post_id,
+        )
+        taken_over = db.session.execute(
+            update(cls.__table__)
+            .where(
+                cls.username == username,
+                cls.subreddit == subreddit,
+                cls.post_id == post_id,
+                or_(cls.expires_at <= now, cls.worker == worker),
+                ~posted,
+            )
+            .values(worker=worker, token=token, expires_at=expires_at)
+        ).rowcount
+        if taken_over:
+            return True
+
+        held = exists().where(
+            cls.username == username,
+            cls.subreddit == subreddit,
+            cls.post_id == post_id,
+        )
+        return storage.insert_if_absent(
+            db.session,
+            cls.__table__,
+            ["username", "subreddit", "post_id", "worker", "token", "expires_at"],
+            select(
+                literal(username),
+                literal(subreddit),
+                literal(post_id),
+                literal(worker),
+                literal(token),
+                literal(expires_at, db.DateTime),
+            ).where(~held, ~posted),
+        )
+
+    @classmethod
+    def claim_posts(
+        cls, username: str, posts: list, lease: float, worker: str = None
+    ) -> dict:
+        """
+        Checks and claims several posts in a single transaction, under one new claim
+        token.
+
+        Parameters
+        ----------
+        username : str
+            Username to use for the posts.
+        posts : list[dict[str, str]]
+            A list of posts, which should contain the 'subreddit' and 'post_id' keyword.
+        lease : float
+            How long the claims last, in seconds.
+        worker : str, optional
+            The id of the worker claiming the posts, which lets it renew its own
+            claims. If not given, the claims can only be taken over once they expire.
+
+        Returns
+        -------
+        dict
+            The claim 'token', and the 'posts' given, each with the 'claimed' keyword
+            for whether or not they were claimed.
+        """
+        token = str(uuid.uuid4())
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(seconds=min(lease, cls.MAX_LEASE))
+
         result = []
         for post in posts:
-            post_dict = cls.check_post(username, post["subreddit"], post["post_id"])
+            result.append(
+                dict(
+                    username=username,
+                    subreddit=post["subreddit"],
+                    post_id=post["post_id"],
+                    claimed=cls.claim(
+                        username,
+                        worker or token,
+                        token,
+                        post["subreddit"],
+                        post["post_id"],
+                        now,
+                        expires_at,
+                    ),
+                )
+            )
+        db.session.commit()
 
-            result.append(post_dict)
+        return {"token": token, "posts": result}
 
-        return result
+    @classmethod
+    def claimed_keys(cls, username: str, token: str) -> list:
+        """
+        Returns the posts still held under a claim token.
+
+        Parameters
+        ----------
+        username : str
+            Username for the posts.
+        token : str
+            The claim token.
+
+        Returns
+        -------
+        list[tuple[str, str]]
+            The (subreddit, post_id) pairs claimed under the token.
+        """
+        rows = cls.query.with_entities(cls.subreddit, cls.post_id).filter_by(
+            username=username, token=token
+        )
+        return [(subreddit, post_id) for subreddit, post_id in rows]
+
+    @classmethod
+    def delete_claims(cls, username: str, token: str, keys: list) -> int:
+        """
+        Deletes the claims on posts held under a claim token. Claims under other tokens
+        are left alone. Does not commit.
+
+        Parameters
+        ----------
+        username : str
+            Username for the posts.
+        token : str
+            The claim token.
+        keys : list[tuple[str, str]]
+            The (subreddit, post_id) pairs to delete the claims of.
+
+        Returns
+        -------
+        int
+            How many claims were deleted.
+        """
+        deleted = 0
+        for start in range(0, len(keys), Post.QUERY_CHUNK_SIZE):
+            chunk = keys[start : start + Post.QUERY_CHUNK_SIZE]
+            deleted += cls.query.filter(
+                cls.username == username,
+                cls.token == token,
+                tuple_(cls.subreddit, cls.post_id).in_(chunk),
+            ).delete(synchronize_session=False)
+
+        return deleted
+
+    @classmethod
+    def commit_claim(
+        cls, username: str, token: str, posts: list = None
+    ) -> Union[list, None]:
+        """
+        Adds claimed posts once they have been crossposted, and drops their claims.
+        Only posts claimed under the token are accepted: if any of the posts aren't,
+        nothing is added.
+
+        Posts are added even if their lease ran out in the meantime, as long as no other
+        client took the claim over, since they were crossposted either way.
+
+        Parameters
+        ----------
+        username : str
+            Username for the posts.
+        token : str
+            The claim token the posts were claimed under.
+        posts : list[dict[str, str]], optional
+            The posts to add, which should contain the 'subreddit' and 'post_id'
+            keyword, and may contain 'created_utc'. If not given, every post still held
+            under the token is added.
+
+        Returns
+        -------
+        list[dict], optional
+            The posts, each with the 'exists' keyword for whether or not the post
+            existed before being added, or None if the token doesn't hold them.
+        """
+        held = cls.claimed_keys(username, token)
+        if not held:
+            return None
+
+        if posts is None:
+            posts = [
+                dict(subreddit=subreddit, post_id=post_id)
+                for subreddit, post_id in held
+            ]
+
+        # the claims are deleted first, so a claim taken over by another client in the
+        # meantime is noticed in the same transaction the posts are added in
+        keys = list(
+            dict.fromkeys((post["subreddit"], post["post_id"]) for post in posts)
+        )
+        if cls.delete_claims(username, token, keys) < len(keys):
+            db.session.rollback()
+            return None
+
+        return Post.add_posts(username, posts)
+
+    @classmethod
+    def release_claim(cls, username: str, token: str, posts: list = None):
+        """
+        Gives up claimed posts that weren't crossposted, so they can be claimed again.
+
+        Parameters
+        ----------
+        username : str
+            Username for the posts.
+        token : str
+            The claim token the posts were claimed under.
+        posts : list[dict[str, str]], optional
+            The posts to release, which should contain the 'subreddit' and 'post_id'
+            keyword. If not given, every post still held under the token is released.
+        """
+        if posts is None:
+            cls.query.filter_by(username=username, token=token).delete(
+                synchronize_session=False
+            )
+        else:
+            keys = list(
+                dict.fromkeys((post["subreddit"], post["post_id"]) for post in posts)
+            )
+            cls.delete_claims(username, token, keys)
+        db.session.commit()
+
+
+def list_posts(query):
+    """
+    Responds with the posts from a query, narrowed down by the request's query
+    arguments with Post.narrow_query: 'since', 'limit' and the 'after' cursor. A page
+    is returned with the cursor for the next page as 'next', which is null on the last
+    page. With 'format=ndjson', the posts are streamed one per line instead.
+
+    Parameters
+    ----------
+    query : Query
+        The query for the posts.
+
+    Returns
+    -------
+    Response
+        The posts, or an error.
+    """
+    since = request.args.get("since", type=float)
+    if "since" in request.args and Post.from_timestamp(since) is None:
+        return make_response("Error, since needs to be a Unix timestamp.", 415)
+
+    limit = request.args.get("limit", type=int)
+    if "limit" in request.args and (limit is None or limit <= 0):
+        return make_response("Error, limit needs to be a positive integer.", 415)
+
+    after = request.args.get("after", type=int)
+    if "after" in request.args and after is None:
+        return make_response("Error, after needs to be a post id.", 415)
+
+    response_format = request.args.get("format", "json")
+    if response_format not in ("json", "ndjson"):
+        return make_response("Error, format needs to be json or ndjson.", 415)
+
+    query = Post.narrow_query(query, since, limit, after)
+    if response_format == "ndjson":
+        return Post.stream_query(query)
+    if after is None:
+        return Post.jsonify_query(query)
+
+    posts = query.all()
+    next_cursor = None
+    if len(posts) == min(limit or Post.PAGE_SIZE, Post.MAX_PAGE_SIZE):
+        next_cursor = posts[-1].id
+
+    return jsonify({"posts": [post.to_dict() for post in posts], "next": next_cursor})
 
 
 @posts_page.get("/")
@@ -228,10 +834,12 @@ def check_multiple_posts(current_user: User):
     Returns
     -------
     response
-        A response either with JSON containing the desired posts, or an error.
+        A response either with JSON containing the desired posts, or an error. Without
+        a JSON body, all of the user's posts are listed, which takes the query
+        arguments of list_posts to paginate or stream them.
     """
     if not request.is_json:
-        return Post.jsonify_query(Post.query.filter_by(username=current_user.username))
+        return list_posts(Post.query.filter_by(username=current_user.username))
 
     data = request.get_json()
 
@@ -273,10 +881,13 @@ def check_subreddit(current_user: User, subreddit: str):
     Returns
     -------
     Response
-        The JSON for all the posts found on that subreddit.
+        The JSON for the posts found on that subreddit, or an error. Takes the query
+        arguments of list_posts, like 'since' (a Unix timestamp) and 'limit' to only
+        get the most recent posts.
     """
-    posts = Post.query.filter_by(username=current_user.username, subreddit=subreddit)
-    return Post.jsonify_query(posts), 200
+    return list_posts(
+        Post.query.filter_by(username=current_user.username, subreddit=subreddit)
+    )
 
 
 @posts_page.post("/")
@@ -315,8 +926,121 @@ def add_subreddit_posts(current_user: User):
             return make_response("Error, post needs to be a dict.", 415)
 
         checked_post = Post.add_post(
-            current_user.username, post["subreddit"], post["post_id"]
+            current_user.username,
+            post["subreddit"],
+            post["post_id"],
+            post.get("created_utc"),
         )
         return jsonify(checked_post), 200
 
     return make_response("Error, need a posts list or post object.", 415)
+
+
+@posts_page.post("/claim")
+@token_required
+def claim_posts(current_user: User):
+    """
+    Checks and claims posts in one step, for a client that is about to crosspost them.
+    Only posts that haven't been added and aren't claimed by another client are
+    claimed. The claim token returned is used to commit or release the claims.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with the claim token and the result of claiming the posts, or an error.
+    """
+    if not request.is_json:
+        return make_response("Request must be in JSON.", 415)
+
+    data = request.get_json()
+
+    worker = data.get("worker")
+    if worker is not None and not isinstance(worker, str):
+        return make_response("Error, worker needs to be a string.", 415)
+
+    posts = data.get("posts")
+    if not isinstance(posts, list):
+        return make_response("Error, posts needs to be a list.", 415)
+
+    lease = data.get("lease", 300)
+    if not isinstance(lease, (int, float)) or lease <= 0:
+        return make_response("Error, lease needs to be a positive number.", 415)
+
+    result = PostClaim.claim_posts(current_user.username, posts, lease, worker)
+
+    return jsonify(result), 200
+
+
+@posts_page.post("/claim/<token>/commit")
+@token_required
+def commit_claim(current_user: User, token: str):
+    """
+    Adds claimed posts once they have been crossposted. Takes an optional posts list to
+    commit only some of the claimed posts. Nothing is added unless every post is
+    claimed under the token.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+    token : str
+        The claim token.
+
+    Returns
+    -------
+    Response
+        JSON with the result of adding the posts, or an error: 404 if the token doesn't
+        hold any claims of the current user, and 409 if some of the posts aren't
+        claimed under it, like when their lease ran out and another client claimed
+        them.
+    """
+    posts = None
+    if request.is_json:
+        posts = request.get_json().get("posts")
+        if posts is not None and not isinstance(posts, list):
+            return make_response("Error, posts needs to be a list.", 415)
+
+    result = PostClaim.commit_claim(current_user.username, token, posts)
+    if result is None:
+        if not PostClaim.claimed_keys(current_user.username, token):
+            return make_response("Error, unknown claim token.", 404)
+        return make_response(
+            "Error, the posts aren't all claimed under this token.", 409
+        )
+
+    return jsonify(result), 200
+
+
+@posts_page.post("/claim/<token>/release")
+@token_required
+def release_claim(current_user: User, token: str):
+    """
+    Gives up claimed posts that weren't crossposted. Takes an optional posts list to
+    release only some of the claimed posts.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+    token : str
+        The claim token.
+
+    Returns
+    -------
+    Response
+        Whether or not the claims were released.
+    """
+    posts = None
+    if request.is_json:
+        posts = request.get_json().get("posts")
+        if posts is not None and not isinstance(posts, list):
+            return make_response("Error, posts needs to be a list.", 415)
+
+    PostClaim.release_claim(current_user.username, token, posts)
+
+    return jsonify({"message": "released"}), 200
@@ -0,0 +1,263 @@
+"""
+Keeps the posts table from growing forever. The client only ever looks at the newest
+few posts of each subreddit, so older posts can never be checked again and only slow
+down the indexes. A background thread regularly deletes them, by count or by age, a
+chunk at a time so requests aren't held up for long, and then hands the freed space
+back.
+"""
+
+import datetime
+import fcntl
+import threading
+import time
+
+from sqlalchemy import DateTime, bindparam, text
+
+# posts deleted per transaction
+CHUNK_SIZE = 1000
+
+
+def delete_in_chunks(engine, where: str, params: dict, chunk_size: int) -> int:
+    """
+    Deletes the posts matching a condition, each chunk in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    where : str
+        The SQL condition posts are deleted by.
+    params : dict
+        The condition's parameters. A 'cutoff' datetime is bound as a DateTime.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    statement = text(
+        "DELETE FROM posts WHERE id IN "
+        "(SELECT id FROM posts WHERE {} LIMIT :chunk_size)".format(where)
+    )
+    if isinstance(params.get("cutoff"), datetime.datetime):
+        statement = statement.bindparams(bindparam("cutoff", type_=DateTime))
+
+    removed = 0
+    while True:
+        with engine.begin() as connection:
+            deleted = connection.execute(
+                statement, dict(params, chunk_size=chunk_size)
+            ).rowcount
+        removed += deleted
+        if deleted < chunk_size:
+            return removed
+
+
+def prune_posts(engine, keep_last: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Deletes all but the newest keep_last posts of each user's subreddits. Each chunk is
+    deleted in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    keep_last : int
+        How many posts to keep for each user and subreddit.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    with engine.connect() as connection:
+        groups = connection.execute(
+            text(
+                "SELECT username, subreddit FROM posts GROUP BY username, subreddit "
+                "HAVING COUNT(*) > :keep_last"
+            ),
+            {"keep_last": keep_last},
+        ).all()
+
+    removed = 0
+    for username, subreddit in groups:
+        group = {"username": username, "subreddit": subreddit}
+        with engine.connect() as connection:
+            # the oldest post that is kept
+            cutoff = connection.execute(
+                text(
+                    "SELECT id FROM posts "
+                    "WHERE username = :username AND subreddit = :subreddit "
+                    "ORDER BY id DESC LIMIT 1 OFFSET :offset"
+                ),
+                dict(group, offset=keep_last - 1),
+            ).scalar()
+
+        removed += delete_in_chunks(
+            engine,
+            "username = :username AND subreddit = :subreddit AND id < :cutoff",
+            dict(group, cutoff=cutoff),
+            chunk_size,
+        )
+
+    return removed
+
+
+def prune_old_posts(engine, max_age_days: float, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Deletes posts made on Reddit more than max_age_days ago. Posts whose creation time
+    isn't known go by when they were added instead. Each chunk is deleted in its own
+    transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+    max_age_days : float
+        How old a post can get before it's deleted, in days.
+    chunk_size : int
+        The most posts deleted per transaction.
+
+    Returns
+    -------
+    int
+        The number of posts deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=max_age_days)
+    with engine.connect() as connection:
+        groups = connection.execute(
+            text("SELECT DISTINCT username, subreddit FROM posts")
+        ).all()
+
+    removed = 0
+    # one group at a time, so the (username, subreddit, created_utc) index is used
+    for username, subreddit in groups:
+        removed += delete_in_chunks(
+            engine,
+            "username = :username AND subreddit = :subreddit AND (created_utc < :cutoff "
+            "OR (created_utc IS NULL AND posted_at < :cutoff))",
+            dict(username=username, subreddit=subreddit, cutoff=cutoff),
+            chunk_size,
+        )
+
+    return removed
+
+
+def prune_claims(engine) -> int:
+    """
+    Deletes claims whose lease ran out without them being committed or released.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to prune.
+
+    Returns
+    -------
+    int
+        The number of claims deleted.
+    """
+    with engine.begin() as connection:
+        return connection.execute(
+            text("DELETE FROM post_claims WHERE expires_at < :now"),
+            {"now": datetime.datetime.utcnow()},
+        ).rowcount
+
+
+def compact(engine):
+    """
+    Hands the space freed by deleted rows back. SQLite databases are switched to
+    incremental auto vacuum with one full VACUUM the first time, after which only the
+    free pages have to be released. PostgreSQL tables are vacuumed and analyzed. Other
+    databases are left to themselves.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database to compact.
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as connection:
+        # VACUUM can't run inside a transaction
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        if dialect == "sqlite":
+            if connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                print("Switching the database to incremental vacuum, this runs once.")
+                connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                connection.exec_driver_sql("VACUUM")
+            else:
+                connection.exec_driver_sql("PRAGMA incremental_vacuum")
+        elif dialect == "postgresql":
+            connection.exec_driver_sql("VACUUM ANALYZE posts")
+
+
+class RetentionJob(threading.Thread):
+    """
+    Background thread that prunes and compacts the database every interval seconds.
+
+    Every gunicorn worker starts one, so they take a lock file first and only the
+    worker holding it does the work.
+
+    Parameters
+    ----------
+    engine : Engine
+        The engine for the database.
+    keep_last : int
+        How many posts to keep for each user and subreddit, or 0 to keep them all.
+    max_age_days : float
+        How old posts can get before they're deleted, in days, or 0 to keep them all.
+    interval : float
+        How long to wait between runs, in seconds.
+    lock_path : str
+        The lock file shared between the workers.
+    """
+
+    def __init__(
+        self,
+        engine,
+        keep_last: int,
+        max_age_days: float,
+        interval: float,
+        lock_path: str,
+    ):
+        super().__init__(name="retention", daemon=True)
+        self.engine = engine
+        self.keep_last = keep_last
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.lock_path = lock_path
+
+    def run_once(self):
+        """
+        Prunes and compacts the database once.
+        """
+        removed = 0
+        if self.max_age_days > 0:
+            removed += prune_old_posts(self.engine, self.max_age_days)
+        if self.keep_last > 0:
+            removed += prune_posts(self.engine, self.keep_last)
+        expired = prune_claims(self.engine)
+        if removed or expired:
+            print("Pruned {} old posts and {} expired claims.".format(removed, expired))
+            compact(self.engine)
+
+    def run(self):
+        with open(self.lock_path, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # another worker is doing it
+                return
+
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(
+                        "Error pruning the database, trying again later: {}".format(e)
+                    )
+                time.sleep(self.interval)
@@ -0,0 +1,141 @@
+"""
+Database setup and the statements whose SQL differs between database backends.
+
+The server runs on SQLite by default, but any database SQLAlchemy supports can be used
+by giving a full SQLAlchemy URL, which lets the server scale past SQLite's single
+writer when running several gunicorn workers.
+"""
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+# inserts that can skip rows breaking a unique constraint, instead of failing
+CONFLICT_IGNORING_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def database_uri(value: str, database_folder: str) -> str:
+    """
+    Works out the SQLAlchemy URL of the database from the config. A full URL is used as
+    is, anything else is taken as the name of an SQLite file in the database folder.
+
+    Parameters
+    ----------
+    value : str
+        The SQLALCHEMY_DATABASE_URI config value.
+    database_folder : str
+        The folder SQLite files are kept in.
+
+    Returns
+    -------
+    str
+        The SQLAlchemy URL.
+    """
+    if "://" in value:
+        return value
+
+    return "sqlite:///" + database_folder + value
+
+
+def engine_options(uri: str, section) -> dict:
+    """
+    Works out the engine's connection pool options. Servers like PostgreSQL get a pool
+    sized for gunicorn's threads that checks connections before using them, since the
+    database may close idle ones. Any option can be overridden in the config.
+
+    Parameters
+    ----------
+    uri : str
+        The SQLAlchemy URL of the database.
+    section : configparser.SectionProxy
+        The database section of the config.
+
+    Returns
+    -------
+    dict
+        The keyword arguments for create_engine.
+    """
+    options = {}
+    if not uri.startswith("sqlite"):
+        options = dict(
+            pool_size=5, max_overflow=5, pool_recycle=1800, pool_pre_ping=True
+        )
+
+    for option in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle"):
+        if option in section:
+            options[option] = section.getint(option)
+    if "pool_pre_ping" in section:
+        options["pool_pre_ping"] = section.getboolean("pool_pre_ping")
+
+    return options
+
+
+def sqlite_pragmas(busy_timeout: int):
+    """
+    Makes a connect listener that tunes SQLite connections for a server: WAL lets
+    readers carry on while a write is happening, synchronous=NORMAL only syncs at
+    checkpoints (a crash can lose the last few commits, but never corrupts the
+    database), and the busy timeout makes writers wait for the lock instead of failing
+    straight away.
+
+    Parameters
+    ----------
+    busy_timeout : int
+        How long to wait for a lock, in milliseconds.
+
+    Returns
+    -------
+    Callable
+        The listener, for the engine's 'connect' event.
+    """
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout={}".format(int(busy_timeout)))
+        cursor.close()
+
+    return set_pragmas
+
+
+def insert_if_absent(session, table, columns: list, select) -> bool:
+    """
+    Runs an INSERT ... SELECT that skips the row if it would break a unique constraint,
+    such as when a concurrent request inserted the same row first. Uses ON CONFLICT DO
+    NOTHING where the database supports it, and a savepoint elsewhere. Does not commit.
+
+    Parameters
+    ----------
+    session : Session
+        The session to run the insert in.
+    table : Table
+        The table to insert into.
+    columns : list[str]
+        The columns being inserted.
+    select : Select
+        The select producing the row to insert, or nothing.
+
+    Returns
+    -------
+    bool
+        True if the row was inserted.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect in CONFLICT_IGNORING_INSERTS:
+        statement = (
+            CONFLICT_IGNORING_INSERTS[dialect](table)
+            .from_select(columns, select)
+            .on_conflict_do_nothing()
+        )
+        return session.execute(statement).rowcount == 1
+
+    try:
+        with session.begin_nested():
+            statement = insert(table).from_select(columns, select)
+            return session.execute(statement).rowcount == 1
+    except IntegrityError:
+        return False
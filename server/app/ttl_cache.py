@@ -0,0 +1,121 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    A bounded, thread safe cache where entries also expire after a while. Once full,
+    the least recently used entry is evicted to make room.
+
+    The cache is per process, so with several gunicorn workers each has its own, and
+    invalidating an entry only reaches the worker that handled the request. Keep the
+    ttl short enough that entries left behind elsewhere don't matter.
+
+    Parameters
+    ----------
+    maxsize : int
+        The most entries kept.
+    ttl : float
+        How long an entry is kept, in seconds.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expiry time, value), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value for a key.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key to look up.
+
+        Returns
+        -------
+        Any
+            The value, or None if the key isn't cached or has expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl: float = None):
+        """
+        Caches a value.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key to cache the value under.
+        value : Any
+            The value.
+        ttl : float, optional
+            How long to keep this entry, if it should go sooner than the cache's ttl.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        """
+        Removes the entries whose values match a predicate.
+
+        Parameters
+        ----------
+        predicate : Callable[[Any], bool]
+            Called with each value, entries it returns True for are removed.
+        """
+        with self.lock:
+            for key in [
+                key for key, (_, value) in self.entries.items() if predicate(value)
+            ]:
+                del self.entries[key]
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the cache's size and hit/miss counters.
+
+        Returns
+        -------
+        dict
+            The 'size', 'maxsize', 'hits', 'misses' and 'evictions' of the cache.
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
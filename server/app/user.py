@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 from flask import request, jsonify, make_response, Blueprint, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
+from collections import namedtuple
+import hashlib
+import secrets
 import uuid
 import jwt
 import datetime
+import time
 from functools import wraps
 
+from .ttl_cache import TTLCache
 
 users_page = Blueprint("users_page", __name__)
 
 with current_app.app_context():
     db = current_app.config["database"]
+    # verified tokens -> the user they belong to, so authenticated requests don't each
+    # need a database query
+    user_cache = TTLCache(
+        current_app.config["user_cache_size"], current_app.config["user_cache_ttl"]
+    )
+
+# the parts of a user that requests need, cached instead of the User row so that no
+# detached database objects are kept around
+UserRecord = namedtuple("UserRecord", ["id", "public_id", "username", "admin"])
 
 
 class User(db.Model):
@@ -39,6 +53,100 @@ class User(db.Model):
         self.admin = admin
 
 
+class ApiKey(db.Model):
+    """
+    A long-lived key a client can exchange for tokens, without going through the
+    password check each time. Only a sha256 hash of the key is stored: keys are long
+    and random, so unlike passwords they don't need a slow salted hash, and can be
+    looked up directly by their hash.
+
+    Parameters
+    ----------
+    db : Any
+        A database connection.
+    """
+
+    __tablename__ = "api_keys"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    key_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_on = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def create(cls, user_id: int) -> str:
+        """
+        Makes a new key for a user. Does not commit.
+
+        Parameters
+        ----------
+        user_id : int
+            The id of the user the key is for.
+
+        Returns
+        -------
+        str
+            The key. It can't be recovered later, since only its hash is stored.
+        """
+        key = secrets.token_urlsafe(32)
+        db.session.add(
+            cls(
+                user_id=user_id,
+                key_hash=cls.hash_key(key),
+                created_on=datetime.datetime.now(),
+            )
+        )
+        return key
+
+    @classmethod
+    def find_user(cls, key: str):
+        """
+        Finds the user a key belongs to.
+
+        Parameters
+        ----------
+        key : str
+            The key.
+
+        Returns
+        -------
+        User
+            The user, or None if the key isn't valid.
+        """
+        return (
+            User.query.join(cls, cls.user_id == User.id)
+            .filter(cls.key_hash == cls.hash_key(key))
+            .first()
+        )
+
+
+def make_token(user: User) -> str:
+    """
+    Makes a token for a user, valid for 30 minutes.
+
+    Parameters
+    ----------
+    user : User
+        The user to make the token for.
+
+    Returns
+    -------
+    str
+        The token.
+    """
+    return jwt.encode(
+        {
+            "username": user.username,
+            "public_id": user.public_id,
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=30),
+        },
+        current_app.config["SECRET_KEY"],
+    )
+
+
 def token_required(f):
     """
     A decorator for requiring certain actions to use a token.
@@ -64,11 +172,23 @@ def token_required(f):
                 "Please supply a username and password.",
             )
 
-        try:
-            data = jwt.decode(token, current_app.config["SECRET_KEY"], "HS256")
-        except jwt.exceptions.DecodeError:
-            return make_response("Error with token.", 400)
-        current_user = User.query.filter_by(public_id=data["public_id"]).first()
+        current_user = user_cache.get(token)
+        if current_user is None:
+            try:
+                data = jwt.decode(token, current_app.config["SECRET_KEY"], "HS256")
+            except jwt.exceptions.ExpiredSignatureError:
+                return make_response("Token expired.", 401)
+            except jwt.exceptions.DecodeError:
+                return make_response("Error with token.", 400)
+            user = User.query.filter_by(public_id=data["public_id"]).first()
+            if not user:
+                return make_response("User not found.", 401)
+
+            current_user = UserRecord(
+                user.id, user.public_id, user.username, user.admin
+            )
+            # never kept past the token's own expiry
+            user_cache.put(token, current_user, data.get("exp", 0) - time.time())
 
         return f(current_user=current_user, *args, **kwargs)
 
@@ -125,19 +245,78 @@ def login_user():
     user = User.query.filter_by(username=auth.username).first()
 
     if user and check_password_hash(user.password, auth.password):
-        token = jwt.encode(
-            {
-                "username": user.username,
-                "public_id": user.public_id,
-                "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=30),
-            },
-            current_app.config["SECRET_KEY"],
-        )
-        return jsonify({"token": token})
+        return jsonify({"token": make_token(user)})
 
     return make_response("could not verify", 401)
 
 
+@users_page.post("/token")
+def exchange_api_key():
+    """
+    Exchanges an API key for a token. This is much cheaper than logging in with a
+    password, so clients should log in with a password once to make a key, and use the
+    key after that.
+
+    Returns
+    -------
+    Response
+        Returns a token if the key was valid, or an error if it wasn't.
+    """
+    if not request.is_json or not isinstance(request.get_json().get("api_key"), str):
+        return make_response("Error, need an api_key.", 415)
+
+    user = ApiKey.find_user(request.get_json()["api_key"])
+    if not user:
+        return make_response("could not verify", 401)
+
+    return jsonify({"token": make_token(user)})
+
+
+@users_page.post("/api_keys")
+@token_required
+def create_api_key(current_user):
+    """
+    Makes a new API key for the current user.
+
+    Parameters
+    ----------
+    current_user : Any
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with the key. It is only ever shown this once.
+    """
+    key = ApiKey.create(current_user.id)
+    db.session.commit()
+
+    return jsonify({"api_key": key})
+
+
+@users_page.delete("/api_keys")
+@token_required
+def revoke_api_keys(current_user):
+    """
+    Revokes all of the current user's API keys. Tokens already handed out for them
+    stay valid until they expire.
+
+    Parameters
+    ----------
+    current_user : Any
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with how many keys were revoked.
+    """
+    revoked = ApiKey.query.filter_by(user_id=current_user.id).delete()
+    db.session.commit()
+
+    return jsonify({"revoked": revoked})
+
+
 @users_page.delete("/remove_all")
 @token_required
 def remove_all_users(current_user):
@@ -156,7 +335,35 @@ def remove_all_users(current_user):
         otherwise.
     """
     if current_user.admin:
+        ApiKey.query.filter(
+            ApiKey.user_id.in_(User.query.with_entities(User.id).filter_by(admin=False))
+        ).delete(synchronize_session=False)
         User.query.filter_by(admin=False).delete()
+        db.session.commit()
+        user_cache.invalidate(lambda user: not user.admin)
         return make_response("Really hope you meant to do that...", 200)
     else:
         return make_response("You're not an admin, stop trying.", 400)
+
+
+@users_page.get("/cache_stats")
+@token_required
+def user_cache_stats(current_user):
+    """
+    Shows how well the user cache is doing, only available to an admin.
+
+    Parameters
+    ----------
+    current_user : Any
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with the user cache's size and hit/miss counters, or an error if they
+        weren't an admin.
+    """
+    if current_user.admin:
+        return jsonify(user_cache.stats())
+    else:
+        return make_response("You're not an admin, stop trying.", 400)
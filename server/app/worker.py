@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+from flask import request, jsonify, make_response, Blueprint, current_app
+from sqlalchemy import literal, select
+import datetime
+
+from .user import token_required, User
+from . import storage
+
+workers_page = Blueprint("workers_page", __name__)
+
+with current_app.app_context():
+    db = current_app.config["database"]
+
+
+class Worker(db.Model):
+    """
+    A client worker that is sharing a user's subreddits with other workers. Workers
+    send heartbeats, and a worker that stops sending them is left out of the live
+    workers once its heartbeat runs out.
+
+    Parameters
+    ----------
+    db : Any
+        A database connection.
+    """
+
+    __tablename__ = "workers"
+    __table_args__ = (
+        db.Index("ix_workers_username_worker_id", "username", "worker_id", unique=True),
+    )
+    # the longest a heartbeat may last, in seconds
+    MAX_TTL = 3600
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    username = db.Column(db.String(255), nullable=False)
+    worker_id = db.Column(db.String(255), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def heartbeat(cls, username: str, worker_id: str, ttl: float):
+        """
+        Marks a worker as live for the next ttl seconds.
+
+        Parameters
+        ----------
+        username : str
+            The user the worker belongs to.
+        worker_id : str
+            The worker's id.
+        ttl : float
+            How long the worker counts as live without another heartbeat, in seconds.
+        """
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=min(ttl, cls.MAX_TTL)
+        )
+        query = cls.query.filter_by(username=username, worker_id=worker_id)
+        if not query.update({"expires_at": expires_at}):
+            inserted = storage.insert_if_absent(
+                db.session,
+                cls.__table__,
+                ["username", "worker_id", "expires_at"],
+                select(
+                    literal(username),
+                    literal(worker_id),
+                    literal(expires_at, db.DateTime),
+                ),
+            )
+            if not inserted:
+                # a heartbeat from the same worker got in first
+                query.update({"expires_at": expires_at})
+        db.session.commit()
+
+    @classmethod
+    def live_workers(cls, username: str) -> list:
+        """
+        Returns the ids of a user's live workers. Expired workers are removed.
+
+        Parameters
+        ----------
+        username : str
+            The user to get the workers of.
+
+        Returns
+        -------
+        list[str]
+            The worker ids, sorted.
+        """
+        now = datetime.datetime.utcnow()
+        cls.query.filter(cls.username == username, cls.expires_at <= now).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+
+        return [
+            worker_id
+            for worker_id, in cls.query.with_entities(cls.worker_id)
+            .filter_by(username=username)
+            .order_by(cls.worker_id)
+        ]
+
+
+@workers_page.post("/heartbeat")
+@token_required
+def worker_heartbeat(current_user: User):
+    """
+    Records a heartbeat from a worker.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with the user's live workers, or an error.
+    """
+    if not request.is_json:
+        return make_response("Request must be in JSON.", 415)
+
+    data = request.get_json()
+
+    if "worker" not in data or not isinstance(data["worker"], str):
+        return make_response("Error, need a worker id.", 415)
+
+    ttl = data.get("ttl", 300)
+    if not isinstance(ttl, (int, float)) or ttl <= 0:
+        return make_response("Error, ttl needs to be a positive number.", 415)
+
+    Worker.heartbeat(current_user.username, data["worker"], ttl)
+
+    return jsonify({"workers": Worker.live_workers(current_user.username)}), 200
+
+
+@workers_page.get("/")
+@token_required
+def list_workers(current_user: User):
+    """
+    Lists the user's live workers.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+
+    Returns
+    -------
+    Response
+        JSON with the user's live workers.
+    """
+    return jsonify({"workers": Worker.live_workers(current_user.username)}), 200
+
+
+@workers_page.delete("/<worker_id>")
+@token_required
+def remove_worker(current_user: User, worker_id: str):
+    """
+    Removes a worker that is shutting down, so its subreddits are handed to the other
+    workers straight away instead of once its heartbeat runs out.
+
+    Parameters
+    ----------
+    current_user : User
+        The current user.
+    worker_id : str
+        The worker's id.
+
+    Returns
+    -------
+    Response
+        JSON with the user's remaining live workers.
+    """
+    Worker.query.filter_by(username=current_user.username, worker_id=worker_id).delete()
+    db.session.commit()
+
+    return jsonify({"workers": Worker.live_workers(current_user.username)}), 200
@@ -0,0 +1,248 @@
+import configparser
+import types
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    exists,
+    literal,
+    select,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import storage
+
+metadata = MetaData()
+posts = Table(
+    "posts",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("username", String(255), nullable=False),
+    Column("post_id", String(255), nullable=False),
+    Index("ix_posts_username_post_id", "username", "post_id", unique=True),
+)
+COLUMNS = ["username", "post_id"]
+
+
+def post_select(username: str, post_id: str, check_exists: bool = True):
+    statement = select(literal(username), literal(post_id))
+    if check_exists:
+        statement = statement.where(
+            ~exists().where(posts.c.username == username, posts.c.post_id == post_id)
+        )
+    return statement
+
+
+class RecordingSession:
+    """
+    Stands in for a session on a database that isn't available here, recording the
+    statements it's given instead of running them.
+    """
+
+    def __init__(self, dialect_name: str):
+        self.bind = types.SimpleNamespace(
+            dialect=types.SimpleNamespace(name=dialect_name)
+        )
+        self.statements = []
+
+    def get_bind(self):
+        return self.bind
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        return types.SimpleNamespace(rowcount=1)
+
+
+def postgresql_sql(statement) -> str:
+    return str(
+        statement.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"render_postcompile": True}
+        )
+    )
+
+
+def section(**options) -> configparser.SectionProxy:
+    config = configparser.ConfigParser()
+    config["database"] = {key: str(value) for key, value in options.items()}
+    return config["database"]
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    flask_app = Flask(__name__)
+    flask_app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite:///{}".format(
+            tmp_path_factory.mktemp("db") / "database.db"
+        ),
+        SECRET_KEY="secret",
+        allow_registration=False,
+        user_cache_size=8,
+        user_cache_ttl=60,
+    )
+    db = SQLAlchemy(flask_app)
+    flask_app.config["database"] = db
+    with flask_app.app_context():
+        from app import post, worker
+
+        db.create_all()
+        yield types.SimpleNamespace(db=db, post=post, worker=worker)
+
+
+@pytest.fixture
+def postgresql_statements(models, monkeypatch):
+    """
+    Runs the models on SQLite, collecting the SQL each statement they execute compiles
+    to on PostgreSQL. Inserts made with insert_if_absent are built for PostgreSQL too,
+    since their SQL depends on the database.
+    """
+    statements = []
+
+    def before_execute(connection, clauseelement, *args):
+        if not isinstance(clauseelement, sqlite.Insert):
+            statements.append(postgresql_sql(clauseelement))
+
+    insert_if_absent = storage.insert_if_absent
+
+    def recording_insert_if_absent(session, table, columns, select):
+        recording = RecordingSession("postgresql")
+        insert_if_absent(recording, table, columns, select)
+        statements.extend(
+            postgresql_sql(statement) for statement in recording.statements
+        )
+        return insert_if_absent(session, table, columns, select)
+
+    monkeypatch.setattr(storage, "insert_if_absent", recording_insert_if_absent)
+    event.listen(models.db.engine, "before_execute", before_execute)
+    yield statements
+    event.remove(models.db.engine, "before_execute", before_execute)
+
+
+def test_insert_if_absent_inserts_once_on_sqlite(session):
+    assert storage.insert_if_absent(session, posts, COLUMNS, post_select("u", "a"))
+    assert not storage.insert_if_absent(session, posts, COLUMNS, post_select("u", "a"))
+    assert session.query(posts).count() == 1
+
+
+def test_insert_if_absent_skips_unique_conflicts_on_sqlite(session):
+    # without the exists check, only the unique index stops the second insert, as
+    # when two requests race
+    assert storage.insert_if_absent(
+        session, posts, COLUMNS, post_select("u", "a", check_exists=False)
+    )
+    assert not storage.insert_if_absent(
+        session, posts, COLUMNS, post_select("u", "a", check_exists=False)
+    )
+    assert session.query(posts).count() == 1
+
+
+def test_insert_if_absent_uses_on_conflict_on_postgresql():
+    session = RecordingSession("postgresql")
+
+    assert storage.insert_if_absent(session, posts, COLUMNS, post_select("u", "a"))
+
+    (statement,) = session.statements
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO posts (username, post_id) SELECT")
+    assert sql.endswith("ON CONFLICT DO NOTHING")
+
+
+def test_existing_post_keys_compile_on_postgresql(models, postgresql_statements):
+    models.post.Post.existing_post_keys("u", [("a", "1"), ("b", "2")])
+
+    (sql,) = postgresql_statements
+    assert "(posts.subreddit, posts.post_id) IN ((" in sql
+
+
+def test_add_posts_compiles_on_postgresql(models, postgresql_statements):
+    models.post.Post.add_posts("u", [{"subreddit": "a", "post_id": "3"}])
+
+    (insert,) = [sql for sql in postgresql_statements if sql.startswith("INSERT")]
+    assert insert.startswith(
+        "INSERT INTO posts (username, subreddit, post_id, created_utc, posted_at) "
+        "SELECT"
+    )
+    assert insert.endswith("ON CONFLICT DO NOTHING")
+
+
+def test_claim_posts_compiles_on_postgresql(models, postgresql_statements):
+    models.post.PostClaim.claim_posts(
+        "u", [{"subreddit": "a", "post_id": "4"}], 300, "worker"
+    )
+
+    update, insert = [
+        sql for sql in postgresql_statements if sql.startswith(("UPDATE", "INSERT"))
+    ]
+    assert update.startswith("UPDATE post_claims SET worker=")
+    assert "NOT (EXISTS (SELECT" in update
+    assert insert.startswith(
+        "INSERT INTO post_claims "
+        "(username, subreddit, post_id, worker, token, expires_at) SELECT"
+    )
+    assert insert.endswith("ON CONFLICT DO NOTHING")
+
+
+def test_worker_heartbeat_compiles_on_postgresql(models, postgresql_statements):
+    models.worker.Worker.heartbeat("u", "worker", 60)
+
+    update, insert = [
+        sql for sql in postgresql_statements if sql.startswith(("UPDATE", "INSERT"))
+    ]
+    assert update.startswith("UPDATE workers SET expires_at=")
+    assert insert.startswith(
+        "INSERT INTO workers (username, worker_id, expires_at) SELECT"
+    )
+    assert insert.endswith("ON CONFLICT DO NOTHING")
+
+
+def test_engine_options_leave_sqlite_pooling_alone():
+    assert storage.engine_options("sqlite:////database_folder/db.db", section()) == {}
+
+
+def test_engine_options_pool_server_databases():
+    options = storage.engine_options("postgresql://user@db/xposter", section())
+
+    assert options == dict(
+        pool_size=5, max_overflow=5, pool_recycle=1800, pool_pre_ping=True
+    )
+
+
+def test_engine_options_are_overridden_by_the_config():
+    options = storage.engine_options(
+        "postgresql://user@db/xposter",
+        section(pool_size=10, pool_timeout=5, pool_pre_ping="false"),
+    )
+
+    assert options == dict(
+        pool_size=10,
+        max_overflow=5,
+        pool_timeout=5,
+        pool_recycle=1800,
+        pool_pre_ping=False,
+    )
+
+
+def test_database_uri():
+    assert storage.database_uri("database.db", "/database_folder/") == (
+        "sqlite:////database_folder/database.db"
+    )
+    assert storage.database_uri("postgresql://user@db/xposter", "/x/") == (
+        "postgresql://user@db/xposter"
+    )